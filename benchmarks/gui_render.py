@@ -0,0 +1,70 @@
+import asyncio
+import time
+import tkinter as tk
+from tkinter.scrolledtext import ScrolledText
+
+import configargparse
+
+import gui
+
+TARGET_SECONDS = 1.0
+
+
+def render_one_by_one(panel, messages):
+    # прежняя схема: на каждое сообщение свои переключения состояния, вставка и промотка
+    for msg in messages:
+        panel['state'] = 'normal'
+        if panel.index('end-1c') != '1.0':
+            panel.insert('end', '\n')
+        panel.insert('end', msg)
+        panel.yview(tk.END)
+        panel['state'] = 'disabled'
+
+
+def render_batched(panel, messages, max_lines):
+    queue = asyncio.Queue()
+    for msg in messages:
+        queue.put_nowait(msg)
+    batch = gui.drain_queue(queue, queue.get_nowait())
+    gui.render_messages(panel, batch, max_lines)
+
+
+def measure(root, render):
+    panel = ScrolledText(root, wrap='none')
+    panel.pack(fill='both', expand=True)
+    root.update()
+
+    started_at = time.perf_counter()
+    render(panel)
+    root.update()
+    elapsed = time.perf_counter() - started_at
+
+    panel.destroy()
+    return elapsed
+
+
+def main():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--messages', default=100_000, type=int, help='Сколько сообщений в очереди')
+    parser.add_argument('--legacy-messages', default=5_000, type=int,
+                        help='Сколько сообщений прогнать по старой схеме (она медленная)')
+    parser.add_argument('--max-lines', default=gui.DEFAULT_MAX_LINES, type=int)
+    args = parser.parse_args()
+
+    messages = [f'user{i % 100}: сообщение номер {i}' for i in range(args.messages)]
+    root = tk.Tk()
+
+    legacy = measure(root, lambda panel: render_one_by_one(panel, messages[:args.legacy_messages]))
+    batched = measure(root, lambda panel: render_batched(panel, messages, args.max_lines))
+    root.destroy()
+
+    legacy_rate = args.legacy_messages / legacy
+    batched_rate = args.messages / batched
+    print(f'По одному: {args.legacy_messages} сообщений за {legacy:.3f} с ({legacy_rate:,.0f} сообщ./с)')
+    print(f'Пачкой:    {args.messages} сообщений за {batched:.3f} с ({batched_rate:,.0f} сообщ./с)')
+    verdict = 'OK' if batched < TARGET_SECONDS else 'МЕДЛЕННО'
+    print(f'Цель < {TARGET_SECONDS:.1f} с: {verdict}')
+
+
+if __name__ == '__main__':
+    main()
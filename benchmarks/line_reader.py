@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import configargparse
+
+from line_reader import open_line_connection
+from messages import ChatMessage
+
+
+def build_payload(count):
+    lines = [f'Игрок{number % 50}: сообщение номер {number} для замера чтения чата\n' for number in range(count)]
+    return ''.join(lines).encode()
+
+
+async def serve_payload(payload):
+    async def handle(reader, writer):
+        writer.write(payload)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def read_with_stream(port, limit):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=limit)
+    count = 0
+    try:
+        while line := await reader.readline():
+            ChatMessage(line)
+            count += 1
+    finally:
+        writer.close()
+    return count
+
+
+async def read_with_protocol(port, max_line_size):
+    connection = await open_line_connection('127.0.0.1', port, max_line_size=max_line_size)
+    count = 0
+    try:
+        while lines := await connection.read_batch():
+            for line in lines:
+                ChatMessage(line)
+            count += len(lines)
+    finally:
+        connection.close()
+    return count
+
+
+async def measure(title, read, payload, rounds, **options):
+    server, port = await serve_payload(payload)
+    best = None
+    try:
+        for _ in range(rounds):
+            started_at = time.perf_counter()
+            count = await read(port, **options)
+            elapsed = time.perf_counter() - started_at
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        server.close()
+        await server.wait_closed()
+    print(f'{title}: {count} строк за {best * 1000:.1f} мс, {count / best:,.0f} строк/с, '
+          f'{len(payload) / best / 1024 / 1024:.1f} МиБ/с')
+
+
+async def check_oversized(title, read, payload, **options):
+    server, port = await serve_payload(payload)
+    try:
+        count = await read(port, **options)
+        print(f'{title}: прочитано {count} строк')
+    except Exception as e:
+        print(f'{title}: соединение потеряно ({e!r})')
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+async def main():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--count', default=500_000, type=int, help='Сколько строк отправит сервер')
+    parser.add_argument('--rounds', default=3, type=int, help='Сколько раз повторить замер, берётся лучший')
+    parser.add_argument('--max-line-size', default=64 * 1024, type=int,
+                        help='Предел длины строки для обоих способов чтения')
+    args = parser.parse_args()
+
+    payload = build_payload(args.count)
+    print(f'Строк: {args.count}, объём: {len(payload) / 1024 / 1024:.1f} МиБ')
+    await measure('StreamReader.readline', read_with_stream, payload, args.rounds, limit=args.max_line_size)
+    await measure('LineProtocol пачками', read_with_protocol, payload, args.rounds, max_line_size=args.max_line_size)
+
+    oversized = b'ok\n' + b'x' * (args.max_line_size * 3) + '\nпосле длинной строки\n'.encode()
+    print(f'Строка длиной {args.max_line_size * 3} байт посреди потока:')
+    await check_oversized('StreamReader.readline', read_with_stream, oversized, limit=args.max_line_size)
+    await check_oversized('LineProtocol пачками', read_with_protocol, oversized, max_line_size=args.max_line_size)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
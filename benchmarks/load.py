@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from argparse import Namespace
+from functools import partial
+
+import configargparse
+
+import chat_client
+import event_loop
+import listen_chat
+import send_minechat
+from fake_server import FakeMinechatServer
+from liveness import LivenessMonitor
+from message_bus import MessageBus
+from outbound_queue import OutboundQueue
+from reconnect import ChannelState, ResolverCache, supervise_channel
+from tools import percentile
+
+BENCH_PREFIX = 'bench'
+
+
+class Sink:
+    def put_nowait(self, item):
+        pass
+
+
+class LatencyProbe:
+    def __init__(self):
+        self.received = 0
+        self.latencies = []
+
+    async def consume(self, subscription):
+        while True:
+            message = await subscription.get()
+            self.received += 1
+            parts = message.body.split()
+            if len(parts) == 4 and parts[0] == BENCH_PREFIX:
+                self.latencies.append(time.perf_counter() - float(parts[3]))
+
+
+async def start_listener(host, port, monitor, resolver):
+    probe = LatencyProbe()
+    bus = MessageBus()
+    subscription = bus.subscribe('probe')
+    channel = ChannelState('read')
+    run_channel = partial(
+        chat_client.read_msgs, port=port, bus=bus,
+        status_updates_queue=Sink(), liveness=monitor.connection(host), channel=channel
+    )
+    task = asyncio.gather(
+        supervise_channel(channel, run_channel, host, port, resolver),
+        probe.consume(subscription),
+    )
+    return probe, channel, task
+
+
+async def start_sender(host, port, monitor, resolver):
+    sending_queue = OutboundQueue(maxsize=1_000_000)
+    channel = ChannelState('send')
+    run_channel = partial(
+        chat_client.send_msgs, port=port, token=f'bench-token-{id(sending_queue)}', sending_queue=sending_queue,
+        status_updates_queue=Sink(), liveness=monitor.connection(host),
+        ping_interval=monitor.ping_interval, channel=channel
+    )
+    task = asyncio.create_task(supervise_channel(channel, run_channel, host, port, resolver))
+    return sending_queue, channel, task
+
+
+async def wait_established(channels, deadline=30.0):
+    started_at = time.perf_counter()
+    while any(channel.state != 'established' for channel in channels):
+        if time.perf_counter() - started_at > deadline:
+            raise TimeoutError('Клиенты не подключились')
+        await asyncio.sleep(0.005)
+    return time.perf_counter() - started_at
+
+
+async def feed_senders(queues, rate, duration):
+    interval = len(queues) / rate
+    loop = asyncio.get_running_loop()
+    started_at = loop.time()
+    sent = 0
+    for step in range(int(duration / interval)):
+        for sender_id, queue in enumerate(queues):
+            queue.put_nowait(f'{BENCH_PREFIX} {sender_id} {step} {time.perf_counter()}')
+            sent += 1
+        delay = started_at + (step + 1) * interval - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    return sent
+
+
+async def measure_oneshot_sends(host, port, count):
+    args = Namespace(host=host, port=port, token='bench-oneshot', nickname=None, message='oneshot')
+    durations = []
+    for _ in range(count):
+        started_at = time.perf_counter()
+        await send_minechat.handle_connection(args)
+        durations.append(time.perf_counter() - started_at)
+    return durations
+
+
+async def run(args):
+    server = FakeMinechatServer(
+        args.host, 0, 0, message_rate=args.background_rate, latency=args.latency, replay=0
+    )
+    await server.start()
+    host = args.host
+    monitor = LivenessMonitor(args.duration * 10)
+    resolver = ResolverCache()
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    listeners = [await start_listener(host, server.read_port, monitor, resolver) for _ in range(args.listeners)]
+    senders = [await start_sender(host, server.write_port, monitor, resolver) for _ in range(args.senders)]
+    channels = [channel for _, channel, _ in listeners + senders]
+    connect_time = await wait_established(channels)
+    memory_per_client = (tracemalloc.get_traced_memory()[0] - memory_before) / max(len(channels), 1)
+    tracemalloc.stop()
+
+    log_dir = tempfile.mkdtemp(prefix='minechat-bench-')
+    archivers = [
+        asyncio.create_task(listen_chat.watch_chat(host, server.read_port, os.path.join(log_dir, f'{number}.txt')))
+        for number in range(args.archivers)
+    ]
+
+    started_at = time.perf_counter()
+    sent = await feed_senders([queue for queue, _, _ in senders], args.rate, args.duration)
+    await asyncio.sleep(max(args.latency * 2, 0.5))
+    elapsed = time.perf_counter() - started_at
+    received = sum(probe.received for probe, _, _ in listeners)
+
+    # канал отправки узнаёт об обрыве только при следующей записи, поэтому меряем читателей
+    read_channels = [channel for _, channel, _ in listeners]
+    for channel in read_channels:
+        channel.state = 'reconnecting'
+    server.disconnect_all()
+    reconnect_time = await wait_established(read_channels)
+
+    oneshot = await measure_oneshot_sends(host, server.write_port, args.oneshot)
+
+    for task in [task for _, _, task in listeners + senders] + archivers:
+        task.cancel()
+    await asyncio.gather(*[task for _, _, task in listeners + senders], *archivers, return_exceptions=True)
+    await server.close()
+
+    return {
+        'connect_time': connect_time,
+        'sent': sent,
+        'received': received,
+        'elapsed': elapsed,
+        'latencies': [latency for probe, _, _ in listeners for latency in probe.latencies],
+        'flushes': sum(queue.flushes for queue, _, _ in senders),
+        'max_flush': max((queue.max_flush for queue, _, _ in senders), default=0),
+        'reconnect_time': reconnect_time,
+        'memory_per_client': memory_per_client,
+        'oneshot': oneshot,
+    }
+
+
+def print_report(args, results):
+    latencies, flushes, oneshot = results['latencies'], results['flushes'], results['oneshot']
+    sent, received, elapsed = results['sent'], results['received'], results['elapsed']
+
+    print(f'Слушатели: {args.listeners}, отправители: {args.senders}, архиваторы: {args.archivers}')
+    print(f'Подключение всех клиентов: {results["connect_time"] * 1000:.0f} мс')
+    print(f'Отправлено: {sent}, получено всеми слушателями: {received} за {elapsed:.2f} с '
+          f'({received / elapsed:,.0f} сообщ./с)')
+    if latencies:
+        print(f'Задержка доставки: p50 {percentile(latencies, 0.5) * 1000:.2f} мс, '
+              f'p95 {percentile(latencies, 0.95) * 1000:.2f} мс, p99 {percentile(latencies, 0.99) * 1000:.2f} мс')
+    if flushes:
+        print(f'Записей в сокет у отправителей: {flushes}, в среднем {sent / flushes:.2f} сообщ. за запись, '
+              f'максимум {results["max_flush"]}')
+    print(f'Переподключение слушателей после обрыва: {results["reconnect_time"] * 1000:.0f} мс')
+    print(f'Память на клиента: {results["memory_per_client"] / 1024:.1f} КиБ')
+    if oneshot:
+        print(f'send_minechat, одно сообщение: среднее {statistics.mean(oneshot) * 1000:.2f} мс')
+
+
+def get_parser():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес тестового сервера')
+    parser.add_argument('--listeners', default=50, type=int, help='Сколько клиентов читают чат')
+    parser.add_argument('--senders', default=10, type=int, help='Сколько клиентов пишут в чат')
+    parser.add_argument('--archivers', default=2, type=int, help='Сколько listen_chat пишут историю')
+    parser.add_argument('--rate', default=500.0, type=float, help='Суммарный темп отправки, сообщ./с')
+    parser.add_argument('--background-rate', default=0.0, type=float, help='Фоновые сообщения бота, сообщ./с')
+    parser.add_argument('--latency', default=0.0, type=float, help='Задержка на стороне сервера, сек')
+    parser.add_argument('--duration', default=5.0, type=float, help='Длительность замера, сек')
+    parser.add_argument('--oneshot', default=20, type=int, help='Сколько разовых отправок через send_minechat')
+    return parser
+
+
+def main():
+    logging.disable(logging.ERROR)
+
+    parser = get_parser()
+    event_loop.add_loop_argument(parser)
+    args = parser.parse_args()
+    print_report(args, event_loop.run(run(args), args.loop))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import configargparse
+
+from log_setup import LOG_FORMAT, Lazy, setup_logging, stop_logging
+from messages import ChatMessage
+
+logger = logging.getLogger('bench')
+
+PIPE_CHUNK = 4096
+
+
+def open_slow_pipe(bytes_per_second):
+    # как терминал или journald: читатель на том конце забирает вывод не быстрее заданного темпа
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        while chunk := os.read(read_fd, PIPE_CHUNK):
+            time.sleep(len(chunk) / bytes_per_second)
+        os.close(read_fd)
+
+    threading.Thread(target=drain, daemon=True).start()
+    return open(write_fd, 'w', encoding='utf-8')
+
+
+def setup_blocking(stream):
+    # как было: basicConfig, форматирование и запись в поток прямо в цикле событий
+    stop_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, style='{', stream=stream)
+
+
+async def log_messages(messages, lazy, chunk=100):
+    # тот же вызов, что делает listen_chat на каждую принятую строку
+    started_at = time.perf_counter()
+    chunk_started_at = started_at
+    max_stall = 0.0
+    for number, message in enumerate(messages, 1):
+        if lazy:
+            logger.info('%s: %s', 'chat', Lazy(message.format_history))
+        else:
+            logger.info(f'chat: {message.format_history()}')
+        if number % chunk == 0:
+            now = time.perf_counter()
+            max_stall = max(max_stall, now - chunk_started_at)
+            await asyncio.sleep(0)
+            chunk_started_at = time.perf_counter()
+    return time.perf_counter() - started_at, max_stall
+
+
+def run_variant(title, messages, lazy):
+    elapsed, max_stall = asyncio.run(log_messages(messages, lazy))
+    drain_started_at = time.perf_counter()
+    stop_logging()
+    for handler in logging.getLogger().handlers:
+        handler.flush()
+    drain = time.perf_counter() - drain_started_at
+    print(f'{title}:\n    в цикле событий {elapsed * 1e6 / len(messages):.2f} мкс на сообщение '
+          f'({len(messages) / elapsed:,.0f} сообщ./с), худшая пауза цикла {max_stall * 1000:.1f} мс, '
+          f'дозапись после цикла {drain * 1000:.0f} мс')
+
+
+def main():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--count', default=50_000, type=int, help='Сколько сообщений залогировать')
+    parser.add_argument('--rate', default=50.0, type=float, help='Ограничение записей в секунду для варианта с прореживанием')
+    parser.add_argument('--sink', default='pipe', choices=('pipe', 'file'),
+                        help='Куда писать логи: медленный канал, как у терминала, или файл на диске')
+    parser.add_argument('--sink-speed', default=2 * 1024 * 1024, type=int,
+                        help='Скорость чтения канала на том конце, байт/с')
+    args = parser.parse_args()
+
+    messages = [ChatMessage(f'Игрок{number % 50}: сообщение номер {number}\n'.encode()) for number in range(args.count)]
+    if args.sink == 'pipe':
+        stream = open_slow_pipe(args.sink_speed)
+        print(f'Сообщений: {args.count}, логи идут в канал, который читается со скоростью {args.sink_speed} байт/с')
+    else:
+        log_path = os.path.join(tempfile.mkdtemp(prefix='minechat-log-'), 'bench.log')
+        stream = open(log_path, 'w', encoding='utf-8')
+        print(f'Сообщений: {args.count}, логи пишутся в {log_path}')
+
+    with stream:
+        setup_blocking(stream)
+        run_variant('basicConfig, f-строка', messages, False)
+
+        setup_logging(logging.INFO, stream=stream)
+        run_variant('Очередь и поток логирования, ленивые аргументы', messages, True)
+
+        setup_logging(logging.INFO, rate_limits={'bench': args.rate}, stream=stream)
+        run_variant(f'Очередь, ленивые аргументы и не больше {args.rate:.0f} записей/с', messages, True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import logging
+import statistics
+import time
+
+import event_loop
+from benchmarks import line_reader, load
+from line_reader import DEFAULT_MAX_LINE_SIZE
+from tools import percentile
+
+
+async def measure_read(count):
+    payload = line_reader.build_payload(count)
+    server, port = await line_reader.serve_payload(payload)
+    try:
+        started_at = time.perf_counter()
+        received = await line_reader.read_with_protocol(port, DEFAULT_MAX_LINE_SIZE)
+        return received / (time.perf_counter() - started_at)
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def measure_loop(name, args):
+    cpu_started_at = time.process_time()
+    read_rate = event_loop.run(measure_read(args.read_lines), name)
+    results = event_loop.run(load.run(args), name)
+    results['read_rate'] = read_rate
+    results['cpu_time'] = time.process_time() - cpu_started_at
+    return results
+
+
+def print_row(name, results):
+    latencies = results['latencies'] or [0.0]
+    oneshot = results['oneshot'] or [0.0]
+    print(f'{name:<8} {results["read_rate"]:>12,.0f} {percentile(latencies, 0.5) * 1000:>9.2f} '
+          f'{percentile(latencies, 0.99) * 1000:>9.2f} {statistics.mean(oneshot) * 1000:>10.2f} '
+          f'{results["reconnect_time"] * 1000:>12.0f} {results["cpu_time"]:>8.2f}')
+
+
+def main():
+    logging.disable(logging.ERROR)
+
+    parser = load.get_parser()
+    parser.add_argument('--read-lines', default=300_000, type=int, help='Сколько строк прочитать на замер чтения')
+    args = parser.parse_args()
+
+    loops = [event_loop.ASYNCIO]
+    if event_loop.get_loop_factory(event_loop.UVLOOP)[0] == event_loop.UVLOOP:
+        loops.append(event_loop.UVLOOP)
+    else:
+        print('uvloop не установлен (pip install uvloop): замер только для стандартного цикла')
+
+    print(f'Слушатели: {args.listeners}, отправители: {args.senders}, темп: {args.rate:.0f} сообщ./с, '
+          f'длительность: {args.duration:.0f} с')
+    print(f'{"цикл":<8} {"чтение, стр/с":>12} {"p50, мс":>9} {"p99, мс":>9} {"отправка":>10} '
+          f'{"переподкл.":>12} {"CPU, с":>8}')
+    for name in loops:
+        print_row(name, measure_loop(name, args))
+
+
+if __name__ == '__main__':
+    main()
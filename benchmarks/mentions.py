@@ -0,0 +1,77 @@
+import random
+import re
+import time
+
+import configargparse
+
+from mentions import MentionMatcher
+
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюяabcdefghijklmnopqrstuvwxyz'
+
+
+def random_word(rng):
+    return ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(4, 10)))
+
+
+def build_messages(count, keywords, hit_rate, rng):
+    vocabulary = [random_word(rng) for _ in range(2000)]
+    lines = []
+    for number in range(count):
+        words = rng.sample(vocabulary, 8)
+        if rng.random() < hit_rate:
+            words[rng.randrange(len(words))] = rng.choice(keywords).capitalize()
+        lines.append(f'Игрок{number % 50}: {" ".join(words)}, ок?\n'.encode())
+    return lines
+
+
+def naive(keywords):
+    lowered = [keyword.lower() for keyword in keywords]
+
+    def match(raw):
+        text = raw.decode('utf-8', errors='replace').lower()
+        return tuple(keyword for keyword in lowered if keyword in text)
+    return match
+
+
+def combined_regex(keywords):
+    pattern = re.compile('|'.join(rf'\b{re.escape(keyword)}\b' for keyword in keywords), re.IGNORECASE)
+
+    def match(raw):
+        return tuple(pattern.findall(raw.decode('utf-8', errors='replace')))
+    return match
+
+
+def measure(title, match, lines, rounds):
+    best = None
+    for _ in range(rounds):
+        started_at = time.perf_counter()
+        found = sum(1 for line in lines if match(line))
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{title}: {best / len(lines) * 1_000_000:.2f} мкс на сообщение, найдено в {found} сообщениях')
+
+
+def main():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--patterns', default=5000, type=int, help='Сколько слов в списке слежения')
+    parser.add_argument('--count', default=50_000, type=int, help='Сколько сообщений проверить')
+    parser.add_argument('--hit-rate', default=0.01, type=float, help='Доля сообщений с упоминанием')
+    parser.add_argument('--rounds', default=3, type=int, help='Сколько раз повторить замер, берётся лучший')
+    parser.add_argument('--skip-naive', action='store_true', help='Не замерять перебор слов (он медленный)')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    keywords = sorted({random_word(rng) for _ in range(args.patterns)})
+    lines = build_messages(args.count, keywords, args.hit_rate, rng)
+    print(f'Шаблонов: {len(keywords)}, сообщений: {len(lines)}, с упоминанием: {args.hit_rate:.0%}')
+
+    if not args.skip_naive:
+        # перебор и общий regex на порядки медленнее, им хватит и части сообщений
+        sample = lines[:max(1, len(lines) // 50)]
+        measure('Перебор слов в цикле', naive(keywords), sample, 1)
+        measure('Общее регулярное выражение', combined_regex(keywords), sample, 1)
+    measure('MentionMatcher', MentionMatcher(keywords, nickname='Оператор').match, lines, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import configargparse
+
+from history_writer import HistoryWriter
+from messages import ChatMessage, timestamp_prefix
+
+
+def make_lines(count):
+    # строки создаются на лету, как у сокета: что конвейер не удержал, то освобождается
+    for number in range(count):
+        yield f'Пользователь{number % 100}: привет, чат, это сообщение номер {number}\n'.encode()
+
+
+def legacy_pipeline(lines, history):
+    # прежний путь chat_client: строка декодируется у сокета и заново кодируется при записи истории
+    held = []
+    for line in lines:
+        message = line.decode().strip()
+        held.append(message)
+        history.write_line(message)
+    return held
+
+
+def record_pipeline(lines, history):
+    held = []
+    offset = 0
+    for line in lines:
+        message = ChatMessage(line, offset=offset)
+        offset += len(line)
+        held.append(message)
+        history.write_raw(message.line)
+    return held
+
+
+def legacy_archive(lines, history):
+    for line in lines:
+        timestamp = datetime.now().strftime('%d.%m.%y %H:%M')
+        history.write_line(f'[{timestamp}] {line.decode().strip()}')
+
+
+def record_archive(lines, history):
+    for line in lines:
+        message = ChatMessage(line)
+        history.write_raw(timestamp_prefix(message.received_at), message.line)
+
+
+def measure(pipeline, count, history_path):
+    # пачку не сбрасываем: сообщения остаются и в очереди окна, и в буфере истории, как при подвисшем диске
+    history = HistoryWriter(history_path, flush_size=float('inf'), rotate_size=0)
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    started_at = time.perf_counter()
+    held = pipeline(make_lines(count), history)
+    elapsed = time.perf_counter() - started_at
+    memory = tracemalloc.get_traced_memory()[0] - memory_before
+    tracemalloc.stop()
+    del held
+    return memory / count, elapsed / count
+
+
+def main():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--messages', default=100_000, type=int, help='Сколько сообщений пропустить через конвейер')
+    args = parser.parse_args()
+
+    history_path = os.path.join(tempfile.mkdtemp(prefix='minechat-messages-'), 'history.txt')
+
+    print(f'Сообщений: {args.messages}, память на удерживаемое сообщение (очередь окна + буфер истории):')
+    for title, pipeline in [('  строки str', legacy_pipeline), ('  ChatMessage', record_pipeline)]:
+        memory, duration = measure(pipeline, args.messages, history_path)
+        print(f'{title}: {memory:.0f} байт, {duration * 1e6:.2f} мкс на сообщение')
+
+    print('Архив listen_chat, запись строки с временем:')
+    for title, pipeline in [('  strftime на строку', legacy_archive), ('  префикс раз в минуту', record_archive)]:
+        memory, duration = measure(pipeline, args.messages, history_path)
+        print(f'{title}: {memory:.0f} байт, {duration * 1e6:.2f} мкс на сообщение')
+
+
+if __name__ == '__main__':
+    main()
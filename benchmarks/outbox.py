@@ -0,0 +1,61 @@
+import asyncio
+import os
+import tempfile
+import time
+
+import configargparse
+
+from outbound_queue import OutboundQueue
+from outbox import Outbox
+from tools import percentile
+
+
+async def measure_enqueue(queue, count, batch):
+    durations = []
+    ack_durations = []
+    for number in range(count):
+        started_at = time.perf_counter()
+        queue.put_nowait(f'Сообщение номер {number} для замера журнала отправки')
+        durations.append(time.perf_counter() - started_at)
+
+        if queue.qsize() >= batch:
+            await queue.get_batch(batch)
+            started_at = time.perf_counter()
+            queue.acknowledge()
+            ack_durations.append(time.perf_counter() - started_at)
+            # даём фоновому fsync шанс сработать, как в живом клиенте
+            await asyncio.sleep(0)
+    return durations, ack_durations
+
+
+def print_durations(title, durations):
+    print(f'{title}: p50 {percentile(durations, 0.5) * 1e6:.1f} мкс, '
+          f'p99 {percentile(durations, 0.99) * 1e6:.1f} мкс, максимум {max(durations) * 1e6:.1f} мкс')
+
+
+async def main():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--count', default=100_000, type=int, help='Сколько сообщений поставить в очередь')
+    parser.add_argument('--batch', default=64, type=int, help='Размер пачки, которую забирает отправитель')
+    args = parser.parse_args()
+
+    in_memory, _ = await measure_enqueue(OutboundQueue(maxsize=args.count), args.count, args.batch)
+
+    path = os.path.join(tempfile.mkdtemp(prefix='minechat-outbox-'), 'bench.outbox')
+    outbox = Outbox(path)
+    fsync_task = asyncio.create_task(outbox.run())
+    journaled, acks = await measure_enqueue(OutboundQueue(maxsize=args.count, outbox=outbox), args.count, args.batch)
+    fsync_task.cancel()
+    stats = outbox.stats()
+    outbox.close()
+
+    print(f'Сообщений: {args.count}, пачка отправителя: {args.batch}')
+    print_durations('Очередь в памяти', in_memory)
+    print_durations('Очередь с журналом', journaled)
+    # раз в compact_after подтверждений журнал сжимается: здесь видно, не встаёт ли на это цикл событий
+    print_durations('Подтверждение пачки с журналом', acks)
+    print(f'Сжатий журнала: {stats["compactions"]}, размер журнала после замера: {os.path.getsize(path)} байт')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+import statistics
+import subprocess
+import sys
+import time
+
+import configargparse
+
+MODES = [
+    ('интерпретатор без импорта', 'pass'),
+    ('chat_client --headless', 'import chat_client'),
+    ('chat_client с окном', 'import chat_client, gui, gui_from_registration'),
+]
+
+
+def measure_import(statement, runs):
+    durations = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True)
+        durations.append(time.perf_counter() - started_at)
+    return durations
+
+
+def main():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--runs', default=20, type=int, help='Сколько холодных запусков на режим')
+    args = parser.parse_args()
+
+    print(f'Холодный старт процесса до готовности модулей, медиана из {args.runs} запусков:')
+    for title, statement in MODES:
+        durations = measure_import(statement, args.runs)
+        print(f'  {title}: {statistics.median(durations) * 1000:.0f} мс (минимум {min(durations) * 1000:.0f} мс)')
+
+
+if __name__ == '__main__':
+    main()
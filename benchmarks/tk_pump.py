@@ -0,0 +1,74 @@
+import asyncio
+import sys
+import time
+import tkinter as tk
+
+import configargparse
+
+import gui
+from outbound_queue import OutboundQueue
+
+
+class CountingPump(gui.TkPump):
+    def __init__(self, widget):
+        super().__init__(widget)
+        self.steps = 0
+
+    async def step(self):
+        self.steps += 1
+        await super().step()
+
+
+async def legacy_update_tk(root_frame, counter, interval=1 / 120):
+    # прежний цикл: update() 120 раз в секунду независимо от того, есть ли работа
+    while True:
+        root_frame.update()
+        counter[0] += 1
+        await asyncio.sleep(interval)
+
+
+async def measure_cpu(pump_coroutine, duration):
+    task = asyncio.create_task(pump_coroutine)
+    started_cpu = time.process_time()
+    await asyncio.sleep(duration)
+    cpu_spent = time.process_time() - started_cpu
+    task.cancel()
+    return cpu_spent
+
+
+def create_window():
+    # то же окно, что у chat_client, с фокусом в поле ввода: мигающий курсор — событие таймера Tk,
+    # и простой окна честно замерять только с ним
+    try:
+        root, root_frame, input_field, *_ = gui.create_main_window(OutboundQueue(), asyncio.Queue(), asyncio.Queue())
+    except tk.TclError as e:
+        sys.exit(f'Для замера нужен дисплей (например, xvfb-run python -m benchmarks.tk_pump): {e}')
+    root.update()
+    input_field.focus_force()
+    root.update()
+    return root, root_frame
+
+
+async def main():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--duration', default=5.0, type=float, help='Длительность каждого замера, сек')
+    args = parser.parse_args()
+
+    root, root_frame = create_window()
+
+    legacy_steps = [0]
+    legacy = await measure_cpu(legacy_update_tk(root_frame, legacy_steps), args.duration)
+
+    pump = CountingPump(root_frame)
+    pump.watch_input(root)
+    adaptive = await measure_cpu(pump.run(), args.duration)
+
+    print(f'Простой окна чата с фокусом в поле ввода, {args.duration:.0f} с:')
+    print(f'  update() каждые 1/120 с: {legacy * 1000:.1f} мс CPU ({legacy / args.duration:.2%}), '
+          f'{legacy_steps[0] / args.duration:.0f} проходов/с')
+    print(f'  TkPump:                  {adaptive * 1000:.1f} мс CPU ({adaptive / args.duration:.2%}), '
+          f'{pump.steps / args.duration:.0f} проходов/с')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
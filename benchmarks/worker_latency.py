@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+import anyio
+import configargparse
+
+from chat_client import parse_args, start_pipeline
+from fake_server import FakeMinechatServer
+from message_bus import MessageBus
+from outbound_queue import DROP_OLDEST, OutboundQueue
+from outbox import Outbox
+from pipeline_worker import PipelineWorker
+from statuses import ReadConnectionStateChanged
+from tools import percentile
+
+BENCH_PREFIX = 'bench'
+TAIL_POLL_INTERVAL = 0.002
+
+
+def run_server(rate):
+    async def serve():
+        server = FakeMinechatServer('127.0.0.1', 5000, 5050, replay=0)
+        await server.start()
+        interval = 1 / rate
+        started_at = time.monotonic()
+        for number in range(1, 2 ** 62):
+            server.broadcast(f'{BENCH_PREFIX} {number} {time.time()}')
+            delay = started_at + number * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    logging.disable(logging.CRITICAL)
+    asyncio.run(serve())
+
+
+def parse_bench_line(line):
+    parts = line.split()
+    if len(parts) == 3 and parts[0] == BENCH_PREFIX:
+        return int(parts[1]), float(parts[2])
+    return None
+
+
+class HistoryTail:
+    # Отдельный поток следит, когда строка попала в файл истории: это задержка сети и записи на диск,
+    # которую окно видеть не должно
+    def __init__(self, path):
+        self.path = path
+        self.lags = []
+        self.numbers = set()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def _run(self):
+        while not os.path.exists(self.path) and not self._stopping.is_set():
+            time.sleep(TAIL_POLL_INTERVAL)
+        with open(self.path, encoding='utf-8', errors='replace') as f:
+            pending = ''
+            while not self._stopping.is_set():
+                chunk = f.read()
+                if not chunk:
+                    time.sleep(TAIL_POLL_INTERVAL)
+                    continue
+                now = time.time()
+                pending += chunk
+                *lines, pending = pending.split('\n')
+                for line in lines:
+                    parsed = parse_bench_line(line)
+                    if parsed:
+                        self.numbers.add(parsed[0])
+                        self.lags.append(now - parsed[1])
+
+
+class GuiProbe:
+    def __init__(self):
+        self.latencies = []
+        self.read_closed = 0
+
+    async def consume_messages(self, messages_queue):
+        while True:
+            message = await messages_queue.get()
+            parsed = parse_bench_line(message.text)
+            if parsed:
+                self.latencies.append(time.time() - parsed[1])
+
+    async def consume_statuses(self, status_updates_queue):
+        while True:
+            status = await status_updates_queue.get()
+            if status == ReadConnectionStateChanged.CLOSED:
+                self.read_closed += 1
+
+
+async def stall_gui(stall, period):
+    # так выглядит тяжёлая вставка в ScrolledText или долгий root.update(): цикл окна стоит целиком
+    while True:
+        await asyncio.sleep(period)
+        time.sleep(stall)
+
+
+async def run_client(mode, args, duration, stall, period):
+    bus = MessageBus()
+    messages_queue = bus.subscribe('gui', args.max_scrollback, DROP_OLDEST)
+    status_updates_queue = asyncio.Queue()
+    probe = GuiProbe()
+    tail = HistoryTail(args.history)
+    tail.start()
+
+    outbox = worker = None
+    try:
+        async with anyio.create_task_group() as tg:
+            if mode == 'worker':
+                worker = PipelineWorker(args)
+                tg.start_soon(worker.run, messages_queue, status_updates_queue)
+            else:
+                outbox = Outbox(f'{args.history}.outbox')
+                sending_queue = OutboundQueue(outbox=outbox)
+                start_pipeline(tg, args, bus, sending_queue, outbox, status_updates_queue)
+            tg.start_soon(probe.consume_messages, messages_queue)
+            tg.start_soon(probe.consume_statuses, status_updates_queue)
+            tg.start_soon(stall_gui, stall, period)
+
+            await asyncio.sleep(duration)
+            tg.cancel_scope.cancel()
+    finally:
+        if worker:
+            worker.close()
+        if outbox:
+            outbox.close()
+        tail.stop()
+    return probe, tail
+
+
+def print_lags(title, lags):
+    if not lags:
+        print(f'    {title}: нет данных')
+        return
+    print(f'    {title}: p50 {percentile(lags, 0.5) * 1000:.1f} мс, p99 {percentile(lags, 0.99) * 1000:.1f} мс, '
+          f'максимум {max(lags) * 1000:.1f} мс')
+
+
+def main():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--rate', default=2000.0, type=float, help='Сколько сообщений в секунду рассылает сервер')
+    parser.add_argument('--duration', default=6.0, type=float, help='Длительность замера для каждого режима, сек')
+    parser.add_argument('--stall', default=0.5, type=float, help='На сколько секунд подвисает окно')
+    parser.add_argument('--stall-period', default=1.0, type=float, help='Как часто подвисает окно, сек')
+    parser.add_argument('--watchdog-timeout', default=2.0, type=float, help='Таймаут контроля живости, сек')
+    bench_args = parser.parse_args()
+
+    logging.disable(logging.ERROR)
+    context = multiprocessing.get_context('spawn')
+    server = context.Process(target=run_server, args=(bench_args.rate,), daemon=True)
+    server.start()
+    time.sleep(1.0)
+
+    log_dir = tempfile.mkdtemp(prefix='minechat-worker-bench-')
+    print(f'Сервер: {bench_args.rate:.0f} сообщ./с, окно подвисает на {bench_args.stall * 1000:.0f} мс '
+          f'каждые {bench_args.stall_period:.1f} с, таймаут живости {bench_args.watchdog_timeout:.1f} с')
+    try:
+        for mode, title in (('inline', 'Всё в одном процессе'), ('worker', 'Сеть и история в отдельном процессе')):
+            args = parse_args([
+                '--host', '127.0.0.1', '--token', 'bench', '--headless',
+                '--history', os.path.join(log_dir, f'{mode}.txt'),
+                '--history-flush-interval', '0.01', '--history-rotate-size', '0',
+                '--watchdog-timeout', str(bench_args.watchdog_timeout),
+                '--log-level', 'CRITICAL',
+            ])
+            probe, tail = asyncio.run(run_client(
+                mode, args, bench_args.duration, bench_args.stall, bench_args.stall_period
+            ))
+
+            numbers = sorted(tail.numbers)
+            missing = numbers[-1] - numbers[0] + 1 - len(numbers) if numbers else 0
+            print(f'{title}:')
+            print_lags('от сервера до файла истории', tail.lags)
+            print_lags('от сервера до окна', probe.latencies)
+            print(f'    записано в историю: {len(numbers)}, пропусков: {missing}, '
+                  f'обрывов чтения: {probe.read_closed}')
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
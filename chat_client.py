@@ -1,210 +1,507 @@
 import asyncio
-import datetime
+import contextlib
 import json
 import logging
 import os
 import socket
+import stat
+import sys
+import time
+from functools import partial
 
-import aiofiles
 import anyio
 from async_timeout import timeout
 from dotenv import load_dotenv
 
-import gui
-from gui_from_registration import run_registration_process
-from send_minechat import parse_args
+import event_loop
+from dedup import DEFAULT_WINDOW, HOLD_TIMEOUT, ReplayFilter
+from history_loader import DEFAULT_PAGE_SIZE, DEFAULT_TAIL_SIZE, HistoryPager
+from history_storage import DEFAULT_ROTATE_SIZE
+from history_writer import DEFAULT_FLUSH_INTERVAL, DEFAULT_FLUSH_SIZE, HistoryWriter
+from line_reader import DEFAULT_MAX_LINE_SIZE, open_line_connection
+from liveness import DEFAULT_TIMEOUT, LivenessMonitor
+from log_setup import setup_logging
+from mentions import DEFAULT_RELOAD_INTERVAL, MentionMatcher
+from message_bus import DEFAULT_BUFFER_SIZE, MessageBus
+from messages import ChatMessage
+from metrics import REGISTRY, serve_metrics
+from outbound_queue import BLOCK, DEFAULT_BATCH_SIZE, DEFAULT_MAXSIZE, DROP_OLDEST, POLICIES, REJECT, OutboundQueue
+from outbox import DEFAULT_FSYNC_INTERVAL, Outbox
+from rate_limit import TokenBucket
+from reconnect import ChannelState, ResolverCache, supervise_channel
+from registration import register
+from search_index import SearchIndex
+from send_minechat import create_parser
+from statuses import (MentionFound, NicknameReceived, ReadConnectionStateChanged, SendingConnectionStateChanged,
+                      SendingQueueOverflow)
+from tools import sanitize_text, save_token_to_env
 
 logger = logging.getLogger(__name__)
 watchdog_logger = logging.getLogger('watchdog')
 
+received_messages = REGISTRY.counter('minechat_received_messages_total', 'Принято сообщений из чата')
+received_bytes = REGISTRY.counter('minechat_received_bytes_total', 'Принято байт из чата')
+sent_messages = REGISTRY.counter('minechat_sent_messages_total', 'Отправлено сообщений в чат')
+
+
+def add_session_arguments(parser):
+    # для тех, кто держит соединение долго (chat_client и relay): очередь и журнал отправки, живость, метрики
+    parser.add_argument('--watchdog-timeout', default=DEFAULT_TIMEOUT, type=float, env_var='MINECHAT_WATCHDOG_TIMEOUT',
+                        help='Сколько секунд тишины терпеть до переподключения; пинги идут втрое чаще')
+    parser.add_argument('--send-queue-size', default=DEFAULT_MAXSIZE, type=int, env_var='MINECHAT_SEND_QUEUE_SIZE',
+                        help='Сколько неотправленных сообщений держать в очереди')
+    parser.add_argument('--send-queue-policy', default=REJECT, choices=POLICIES, env_var='MINECHAT_SEND_QUEUE_POLICY',
+                        help='Что делать при переполненной очереди: block — ждать, drop-oldest — выбросить старейшее, '
+                             'reject — не принимать новое')
+    parser.add_argument('--send-batch', default=DEFAULT_BATCH_SIZE, type=int, env_var='MINECHAT_SEND_BATCH',
+                        help='Сколько сообщений из очереди отправлять одной записью в сокет')
+    parser.add_argument('--outbox', env_var='MINECHAT_OUTBOX',
+                        help='Путь к журналу неотправленных сообщений (по умолчанию рядом с историей)')
+    parser.add_argument('--outbox-fsync-interval', default=DEFAULT_FSYNC_INTERVAL, type=float,
+                        env_var='MINECHAT_OUTBOX_FSYNC_INTERVAL', help='Как часто сбрасывать журнал отправки на диск, сек')
+    parser.add_argument('--metrics-port', default=0, type=int, env_var='MINECHAT_METRICS_PORT',
+                        help='Порт HTTP для метрик в формате Prometheus (0 — не запускать)')
+    parser.add_argument('--metrics-host', default='127.0.0.1', env_var='MINECHAT_METRICS_HOST',
+                        help='Адрес, на котором отдавать метрики')
+
+
+def parse_args(argv=None):
+    parser = create_parser()
+    add_session_arguments(parser)
+    parser.add_argument('--headless', action='store_true', env_var='MINECHAT_HEADLESS',
+                        help='chat_client без окна: чат печатается в stdout, сообщения читаются из stdin')
+    parser.add_argument('--worker-process', action='store_true', env_var='MINECHAT_WORKER_PROCESS',
+                        help='Держать соединение, переподключения и запись истории в отдельном процессе, '
+                             'чтобы подвисшее окно не мешало сети')
+    parser.add_argument('--history-tail', default=DEFAULT_TAIL_SIZE, type=int,
+                        env_var='MINECHAT_HISTORY_TAIL', help='Сколько последних сообщений показать при запуске')
+    parser.add_argument('--history-page', default=DEFAULT_PAGE_SIZE, type=int,
+                        env_var='MINECHAT_HISTORY_PAGE', help='Сколько старых сообщений подгружать при прокрутке вверх')
+    parser.add_argument('--max-scrollback', default=10000, type=int,
+                        env_var='MINECHAT_MAX_SCROLLBACK', help='Сколько строк держать в окне чата')
+    parser.add_argument('--history-buffer', default=DEFAULT_BUFFER_SIZE, type=int, env_var='MINECHAT_HISTORY_BUFFER',
+                        help='Сколько принятых сообщений может ждать записи в историю, прежде чем чтение чата притормозит')
+    parser.add_argument('--max-line-size', default=DEFAULT_MAX_LINE_SIZE, type=int, env_var='MINECHAT_MAX_LINE_SIZE',
+                        help='Строки чата длиннее стольких байт обрезаются, остаток до перевода строки выбрасывается')
+    parser.add_argument('--dedup-window', default=DEFAULT_WINDOW, type=int, env_var='MINECHAT_DEDUP_WINDOW',
+                        help='Сколько последних строк помнить, чтобы не показывать и не писать в историю '
+                             'строки, повторённые сервером после переподключения (0 — не отсеивать)')
+    parser.add_argument('--watch-list', env_var='MINECHAT_WATCH_LIST',
+                        help='Файл со словами и фразами для слежения, по одному на строку: сообщения с ними и с вашим '
+                             'ником подсвечиваются и вызывают оповещение; файл перечитывается при изменении')
+    parser.add_argument('--watch-list-interval', default=DEFAULT_RELOAD_INTERVAL, type=float,
+                        env_var='MINECHAT_WATCH_LIST_INTERVAL', help='Как часто проверять, не изменился ли список слежения, сек')
+    parser.add_argument('--search-index', env_var='MINECHAT_SEARCH_INDEX',
+                        help='Путь к базе поискового индекса истории (по умолчанию рядом с историей)')
+    parser.add_argument('--no-search-index', action='store_true', env_var='MINECHAT_NO_SEARCH_INDEX',
+                        help='Не вести поисковый индекс и не показывать поиск в окне; без окна индекс не ведётся и так')
+    parser.add_argument('--history-flush-size', default=DEFAULT_FLUSH_SIZE, type=int,
+                        env_var='MINECHAT_HISTORY_FLUSH_SIZE', help='Размер пачки истории в байтах перед записью')
+    parser.add_argument('--history-flush-interval', default=DEFAULT_FLUSH_INTERVAL, type=float,
+                        env_var='MINECHAT_HISTORY_FLUSH_INTERVAL', help='Максимальная задержка записи истории, сек')
+    parser.add_argument('--history-fsync', action='store_true',
+                        env_var='MINECHAT_HISTORY_FSYNC', help='Делать fsync после каждой пачки истории')
+    parser.add_argument('--history-rotate-size', default=DEFAULT_ROTATE_SIZE, type=int,
+                        env_var='MINECHAT_HISTORY_ROTATE_SIZE',
+                        help='Переносить историю в сжатый сегмент по достижении этого размера, байт (0 — не переносить)')
+    parser.add_argument('--history-rotate-daily', action='store_true', env_var='MINECHAT_HISTORY_ROTATE_DAILY',
+                        help='Начинать новый сегмент истории каждый день')
+    return parser.parse_args(argv)
+
 
 async def get_valid_token(args):
+    # .env уже прочитан до разбора аргументов, так что токен оттуда лежит в args.token
     if args.token:
         return args.token
 
-    load_dotenv()
-    token = os.getenv('ACCOUNT_HASH')
-
-    if not token:
-        logger.info('Токен не найден. Запускаю регистрацию')
-        await run_registration_process()
+    if args.headless:
+        if not args.nickname:
+            logger.error('Токен не найден. В режиме без окна укажите --nickname для регистрации.')
+            return None
+        account = await register(args.host, args.port, args.nickname)
+        save_token_to_env(account['account_hash'])
+        return account['account_hash']
 
-        load_dotenv(override=True)
-        token = os.getenv('ACCOUNT_HASH')
+    logger.info('Токен не найден. Запускаю регистрацию')
+    from gui_from_registration import run_registration_process
+    await run_registration_process()
 
-    return token
+    load_dotenv(override=True)
+    return os.getenv('ACCOUNT_HASH')
 
 
-async def run_reconnect_loop(args, messages_queue,
+async def run_reconnect_loop(args, bus,
                              sending_queue, status_updates_queue,
-                             watchdog_queue, save_history_queue
+                             liveness_monitor,
+                             read_channel, send_channel, mention_matcher=None
                              ):
-    while True:
-        try:
-            await handle_connection(
-                args.host, 5000, args.token,
-                messages_queue, sending_queue, status_updates_queue,
-                watchdog_queue, save_history_queue
-            )
-        except (ConnectionError, ExceptionGroup, socket.gaierror):
-            logger.info('Потеря соединения. Повторная попытка через 2 сек...')
-            await asyncio.sleep(2)
-
-
-async def handle_connection(host, port, token, messages_queue, sending_queue,
-                            status_updates_queue, watchdog_queue, save_history_queue):
-    async with anyio.create_task_group() as tg:
-        tg.start_soon(read_msgs, host, 5000, messages_queue, save_history_queue,
-                      status_updates_queue, watchdog_queue)
+    await handle_connection(
+        args.host, 5000, args.token,
+        bus, sending_queue, status_updates_queue,
+        liveness_monitor,
+        read_channel, send_channel,
+        bucket=TokenBucket(args.rate) if args.rate else None, max_batch=args.send_batch,
+        max_line_size=args.max_line_size, dedup_window=args.dedup_window, mention_matcher=mention_matcher
+    )
+
 
-        tg.start_soon(send_msgs, host, 5050, token, sending_queue, status_updates_queue, watchdog_queue)
+async def handle_connection(host, port, token, bus, sending_queue,
+                            status_updates_queue, liveness_monitor,
+                            read_channel, send_channel, bucket=None, max_batch=DEFAULT_BATCH_SIZE,
+                            max_line_size=DEFAULT_MAX_LINE_SIZE, dedup_window=DEFAULT_WINDOW, mention_matcher=None):
+    # Каналы чтения и отправки переподключаются независимо: сбой записи не обрывает ленту чата
+    resolver = ResolverCache()
+    liveness = liveness_monitor.connection(host)
+    # окно недавних строк живёт дольше соединения: иначе повтор после переподключения не с чем сравнить
+    replay_filter = ReplayFilter(read_channel.name, dedup_window) if dedup_window else None
 
-        tg.start_soon(watch_for_connection, watchdog_queue)
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(
+            supervise_channel, read_channel,
+            partial(read_with_watchdog, port=5000, bus=bus,
+                    status_updates_queue=status_updates_queue, liveness_monitor=liveness_monitor,
+                    liveness=liveness, channel=read_channel, max_line_size=max_line_size,
+                    replay_filter=replay_filter, mention_matcher=mention_matcher),
+            host, 5000, resolver
+        )
+
+        tg.start_soon(
+            supervise_sending, send_channel,
+            partial(send_msgs, port=5050, token=token, sending_queue=sending_queue,
+                    status_updates_queue=status_updates_queue, liveness=liveness,
+                    ping_interval=liveness_monitor.ping_interval, channel=send_channel,
+                    bucket=bucket, max_batch=max_batch, mention_matcher=mention_matcher),
+            host, 5050, resolver, status_updates_queue
+        )
+
+
+async def supervise_sending(send_channel, run_channel, host, port, resolver, status_updates_queue):
+    # с неверным токеном переподключаться бесполезно: останавливаем только отправку, чтение чата продолжается
+    try:
+        await supervise_channel(send_channel, run_channel, host, port, resolver)
+    except InvalidToken as e:
+        logger.error(str(e))
+        send_channel.state = 'invalid_token'
+        status_updates_queue.put_nowait(SendingConnectionStateChanged.INVALID_TOKEN)
 
 
-async def watch_for_connection(watchdog_queue):
-    check_timeout = 2.0
+async def read_with_watchdog(host, port, bus, status_updates_queue,
+                             liveness_monitor, liveness, channel, max_line_size=DEFAULT_MAX_LINE_SIZE,
+                             replay_filter=None, mention_matcher=None):
+    liveness.touch()
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(
+            read_msgs, host, port, bus, status_updates_queue, liveness, channel, max_line_size, replay_filter,
+            mention_matcher
+        )
+        tg.start_soon(watch_for_connection, liveness_monitor, liveness)
 
-    while True:
-        try:
-            async with timeout(check_timeout) as cm:
-                event_description = await watchdog_queue.get()
-                timestamp = int(datetime.datetime.now().timestamp())
 
-                watchdog_logger.info(f'[{timestamp}] Connection is alive. Source: {event_description}')
-        except asyncio.TimeoutError:
-            if cm.expired:
-                timestamp = int(datetime.datetime.now().timestamp())
-                watchdog_logger.info(f'[{timestamp}] {int(check_timeout)}s timeout is elapsed')
-                raise ConnectionError('Watchdog detected connection timeout')
+async def watch_for_connection(liveness_monitor, liveness):
+    await liveness_monitor.watch(liveness)
 
 
 class InvalidToken(Exception):
     pass
 
 
-async def send_msgs(host, port, token, sending_queue, status_updates_queue, watchdog_queue):
-    status_updates_queue.put_nowait(gui.SendingConnectionStateChanged.INITIATED)
+async def send_msgs(host, port, token, sending_queue, status_updates_queue, liveness, ping_interval, channel=None,
+                    bucket=None, max_batch=DEFAULT_BATCH_SIZE, mention_matcher=None):
+    status_updates_queue.put_nowait(SendingConnectionStateChanged.INITIATED)
     writer = None
 
     try:
         async with timeout(5.0):
             reader, writer = await asyncio.open_connection(host, port)
 
-        status_updates_queue.put_nowait(gui.SendingConnectionStateChanged.ESTABLISHED)
+        status_updates_queue.put_nowait(SendingConnectionStateChanged.ESTABLISHED)
+        if channel:
+            channel.established()
 
         await reader.readline()
         writer.write(f'{token}\n'.encode())
         await writer.drain()
 
         auth_answer = await reader.readline()
-        account_info = json.loads(auth_answer.decode())
+        if not auth_answer:
+            raise ConnectionError('Сервер закрыл соединение при авторизации')
+        try:
+            account_info = json.loads(auth_answer.decode())
+        except ValueError:
+            raise ConnectionError(f'Непонятный ответ на авторизацию: {auth_answer[:100]!r}')
 
         if not account_info:
             raise InvalidToken('Передан неверный токен. Проверьте настройки.')
+        if not isinstance(account_info, dict) or 'nickname' not in account_info:
+            raise ConnectionError(f'Непонятный ответ на авторизацию: {auth_answer[:100]!r}')
 
-        watchdog_queue.put_nowait('Authorization done')
+        liveness.touch()
+        if channel:
+            channel.confirmed()
 
         nickname = account_info['nickname']
         logger.info(f'Выполнена авторизация. Пользователь {nickname}.')
 
-        status_updates_queue.put_nowait(gui.NicknameReceived(nickname))
+        status_updates_queue.put_nowait(NicknameReceived(nickname))
+        if mention_matcher:
+            mention_matcher.set_nickname(nickname)
+
+        if bucket:
+            # пачка не должна быть больше ёмкости ведра, иначе её никогда не пропустит лимит
+            max_batch = max(1, min(max_batch, int(bucket.capacity)))
 
         while True:
             try:
-                async with timeout(20) as cm:
-                    message = await sending_queue.get()
-
-                    clean_message = message.replace('\n', ' ')
-                    writer.write(f'{clean_message}\n\n'.encode())
-                    await writer.drain()
-
-                    watchdog_queue.put_nowait('Message sent')
-
-                    logger.info(f"Сообщение '{clean_message}' улетело на сервер!")
+                async with timeout(ping_interval):
+                    messages = await sending_queue.get_batch(max_batch)
             except asyncio.TimeoutError:
                 writer.write(b'\n')
                 await writer.drain()
+                liveness.touch()
                 watchdog_logger.debug('Application-level PING sent')
+                continue
+
+            if bucket:
+                await bucket.acquire(len(messages))
+
+            clean_messages = [message.replace('\n', ' ') for message in messages]
+            writer.writelines([f'{clean_message}\n\n'.encode() for clean_message in clean_messages])
+            await writer.drain()
+            sending_queue.acknowledge()
+            sent_messages.inc(len(clean_messages))
+
+            liveness.touch()
+
+            if len(clean_messages) == 1:
+                logger.info("Сообщение '%s' улетело на сервер!", clean_messages[0])
+            else:
+                logger.info('%s сообщений улетели на сервер одной пачкой!', len(clean_messages))
     except (ConnectionError, asyncio.TimeoutError, socket.gaierror, OSError) as e:
         logger.error(f'Потеряно соединение с сервером: {e}')
         raise
     finally:
-        status_updates_queue.put_nowait(gui.SendingConnectionStateChanged.CLOSED)
+        status_updates_queue.put_nowait(SendingConnectionStateChanged.CLOSED)
         if writer:
             writer.close()
             await writer.wait_closed()
-        await asyncio.sleep(1)
 
 
-async def save_messages(file_path, queue):
-    async with aiofiles.open(file_path, mode='a', encoding='utf-8') as f:
+async def save_messages(file_path, queue, **writer_options):
+    async with HistoryWriter(file_path, **writer_options) as history:
         while True:
             message = await queue.get()
-            await f.write(f'{message}\n')
+            history.write_raw(message.line)
 
 
-async def load_history(filepath, messages_queue):
+async def print_messages(messages_queue):
+    while True:
+        first_message = await messages_queue.get()
+        messages = [first_message]
+        while messages_queue.qsize():
+            messages.append(messages_queue.get_nowait())
+        sys.stdout.write(''.join(f'{message}\n' for message in messages))
+        sys.stdout.flush()
+
+
+def can_poll(file):
+    # в цикл событий встают только канал, сокет и терминал. Обычный файл или /dev/null connect_read_pipe
+    # иногда принимает, а epoll потом отказывает внутри обратного вызова — такие читаем в потоке
     try:
-        async with aiofiles.open(filepath, mode='r', encoding='utf-8') as f:
-            async for line in f:
-                clean_line = str(line).strip()
-                if clean_line:
-                    messages_queue.put_nowait(clean_line)
-    except FileNotFoundError:
-        ...
+        fd = file.fileno()
+        mode = os.fstat(fd).st_mode
+    except (OSError, ValueError):
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or os.isatty(fd)
+
+
+async def read_console_input(sending_queue, status_updates_queue):
+    loop = asyncio.get_running_loop()
+    read_line = partial(loop.run_in_executor, None, sys.stdin.buffer.readline)
+    if can_poll(sys.stdin):
+        reader = asyncio.StreamReader()
+        try:
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+            read_line = reader.readline
+        except (ValueError, OSError):
+            pass
 
+    while True:
+        line = await read_line()
+        if not line:
+            logger.info('Ввод закончился, продолжаю только читать чат.')
+            return
+
+        message = sanitize_text(line.decode(errors='replace'))
+        if not message:
+            continue
+        try:
+            dropped = await sending_queue.put(message)
+        except asyncio.QueueFull:
+            status_updates_queue.put_nowait(SendingQueueOverflow(sending_queue.qsize()))
+            continue
+        if dropped is not None:
+            status_updates_queue.put_nowait(SendingQueueOverflow(sending_queue.qsize(), dropped))
 
-async def read_msgs(host, port, gui_queue, save_queue, status_updates_queue, watchdog_queue):
-    status_updates_queue.put_nowait(gui.ReadConnectionStateChanged.INITIATED)
-    watchdog_queue.put_nowait('Prompt before auth')
 
-    async with timeout(5.0):
-        reader, writer = await asyncio.open_connection(host, port)
+async def log_status_updates(status_updates_queue):
+    while True:
+        status = await status_updates_queue.get()
+        if isinstance(status, ReadConnectionStateChanged):
+            logger.info(f'Чтение: {status}')
+        if isinstance(status, (SendingConnectionStateChanged, SendingQueueOverflow)):
+            logger.info(f'Отправка: {status}')
+        if isinstance(status, NicknameReceived):
+            logger.info(f'Имя пользователя: {status.nickname}')
+        if isinstance(status, MentionFound):
+            logger.warning(f'Упоминание: {status}')
+
+
+def register_pipeline_metrics(bus, sending_queue, outbox, liveness_monitor, channels):
+    REGISTRY.gauge(
+        'minechat_subscriber_lag', 'Сколько сообщений ждёт каждого подписчика шины',
+        lambda: [({'subscriber': name}, stats['lag']) for name, stats in bus.stats()['subscribers'].items()]
+    )
+    REGISTRY.gauge(
+        'minechat_subscriber_dropped', 'Сколько сообщений выброшено у каждого подписчика шины',
+        lambda: [({'subscriber': name}, stats['dropped']) for name, stats in bus.stats()['subscribers'].items()]
+    )
+    REGISTRY.gauge('minechat_send_queue_depth', 'Сообщений в очереди отправки', sending_queue.qsize)
+    REGISTRY.counter('minechat_send_queue_rejected_total', 'Не принято в переполненную очередь отправки',
+                     collect=lambda: sending_queue.rejected)
+    REGISTRY.counter('minechat_send_queue_dropped_total',
+                     'Вытеснено старых сообщений из переполненной очереди отправки',
+                     collect=lambda: sending_queue.dropped)
+    REGISTRY.gauge('minechat_outbox_pending', 'Неподтверждённых сообщений в журнале отправки',
+                   lambda: outbox.stats()['pending'])
+    REGISTRY.counter('minechat_watchdog_timeouts_total', 'Срабатывания контроля живости соединения',
+                     collect=lambda: liveness_monitor.timeouts)
+    REGISTRY.counter('minechat_watchdog_false_positives_total',
+                     'Подозрения на обрыв, снятые вернувшейся активностью за время отсрочки',
+                     collect=lambda: liveness_monitor.false_positives)
+    REGISTRY.gauge(
+        'minechat_channel_up', 'Канал на связи (1) или нет (0)',
+        lambda: [({'channel': channel.name}, int(channel.state == 'established')) for channel in channels]
+    )
+    REGISTRY.gauge(
+        'minechat_channel_backoff_seconds', 'Пауза перед следующей попыткой подключения канала (0 — не ждёт)',
+        lambda: [({'channel': channel.name}, channel.next_delay if channel.state == 'backoff' else 0.0)
+                 for channel in channels]
+    )
 
-    try:
-        status_updates_queue.put_nowait(gui.ReadConnectionStateChanged.ESTABLISHED)
 
-        while True:
-            async with timeout(10.0):
-                line = await reader.readline()
+def start_pipeline(tg, args, bus, sending_queue, outbox, status_updates_queue, on_commit=None):
+    # сеть, переподключения и запись истории: в процессе окна или в отдельном сетевом процессе
+    # история не теряет ничего и при медленном диске придерживает чтение
+    save_history_queue = bus.subscribe('history', args.history_buffer, BLOCK)
+    liveness_monitor = LivenessMonitor(args.watchdog_timeout)
+    read_channel = ChannelState('read')
+    send_channel = ChannelState('send')
+    register_pipeline_metrics(bus, sending_queue, outbox, liveness_monitor, [read_channel, send_channel])
+    mention_matcher = MentionMatcher()
+
+    tg.start_soon(run_reconnect_loop, args, bus, sending_queue,
+                  status_updates_queue, liveness_monitor,
+                  read_channel, send_channel, mention_matcher)
+
+    if args.watch_list:
+        tg.start_soon(mention_matcher.watch, args.watch_list, args.watch_list_interval)
+
+    tg.start_soon(
+        partial(
+            save_messages, args.history, save_history_queue,
+            flush_size=args.history_flush_size,
+            flush_interval=args.history_flush_interval,
+            fsync=args.history_fsync,
+            rotate_size=args.history_rotate_size,
+            rotate_daily=args.history_rotate_daily,
+            on_commit=on_commit
+        )
+    )
 
-            if not line:
-                break
+    tg.start_soon(outbox.run)
 
-            watchdog_queue.put_nowait('New message in chat')
-            message = line.decode().strip()
-            gui_queue.put_nowait(message)
-            save_queue.put_nowait(message)
-    finally:
-        status_updates_queue.put_nowait(gui.ReadConnectionStateChanged.CLOSED)
-        if writer:
-            writer.close()
-            await writer.wait_closed()
+    if args.metrics_port:
+        tg.start_soon(serve_metrics, args.metrics_host, args.metrics_port)
 
 
-async def main():
-    load_dotenv()
+def load_history(filepath, messages_queue, tail_size):
+    history_pager = HistoryPager(filepath)
+    for line in history_pager.load_tail(tail_size):
+        messages_queue.put_nowait(line)
+    return history_pager
 
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='{levelname} - {name} - {message}',
-        style='{'
-    )
 
-    args = parse_args()
+async def publish_message(bus, message, status_updates_queue, mention_matcher=None):
+    if mention_matcher:
+        mentions = mention_matcher.match(message.raw)
+        if mentions:
+            message.mentions = mentions
+            status_updates_queue.put_nowait(MentionFound(message.text, mentions))
+    await bus.publish(message)
 
-    messages_queue = asyncio.Queue()
-    save_history_queue = asyncio.Queue()
-    sending_queue = asyncio.Queue()
-    status_updates_queue = asyncio.Queue()
-    watchdog_queue = asyncio.Queue()
 
-    await load_history(args.history, messages_queue)
+async def read_msgs(host, port, bus, status_updates_queue, liveness, channel=None,
+                    max_line_size=DEFAULT_MAX_LINE_SIZE, replay_filter=None, mention_matcher=None):
+    status_updates_queue.put_nowait(ReadConnectionStateChanged.INITIATED)
 
-    status_updates_queue.put_nowait(gui.ReadConnectionStateChanged.ESTABLISHED)
+    async with timeout(5.0):
+        connection = await open_line_connection(host, port, max_line_size=max_line_size)
+
+    try:
+        status_updates_queue.put_nowait(ReadConnectionStateChanged.ESTABLISHED)
+        if channel:
+            channel.established()
+        if replay_filter:
+            for message in replay_filter.reconnected():
+                await publish_message(bus, message, status_updates_queue, mention_matcher)
+
+        offset = 0
+        while True:
+            # отдельный таймаут на чтение не нужен: тишину в чате отслеживает liveness-монитор
+            # за одно пробуждение забираем все строки, которые ядро успело положить в буфер
+            if replay_filter and replay_filter.holding:
+                try:
+                    async with timeout(HOLD_TIMEOUT):
+                        lines = await connection.read_batch()
+                except asyncio.TimeoutError:
+                    for message in replay_filter.release():
+                        await publish_message(bus, message, status_updates_queue, mention_matcher)
+                    continue
+            else:
+                lines = await connection.read_batch()
+
+            if not lines:
+                if replay_filter:
+                    for message in replay_filter.release():
+                        await publish_message(bus, message, status_updates_queue, mention_matcher)
+                raise ConnectionError('Сервер закрыл соединение')
+
+            liveness.touch()
+            received_messages.inc(len(lines))
+            # строки одной пачки делят одно время приёма
+            received_at = time.time()
+            for line in lines:
+                received_bytes.inc(len(line))
+                message = ChatMessage(line, received_at, offset=offset)
+                offset += len(line)
+                if not replay_filter:
+                    await publish_message(bus, message, status_updates_queue, mention_matcher)
+                    continue
+                for message in replay_filter.feed(message):
+                    await publish_message(bus, message, status_updates_queue, mention_matcher)
+    finally:
+        status_updates_queue.put_nowait(ReadConnectionStateChanged.CLOSED)
+        connection.close()
 
-    args = parse_args()
+
+async def main(args):
+    setup_logging(args.log_level or logging.DEBUG, args.log_levels, args.log_rate)
+
+    stop_errors = (KeyboardInterrupt, asyncio.exceptions.CancelledError)
+    if not args.headless:
+        # tkinter и окно грузим только для графического режима: без дисплея клиент работает и так
+        import gui
+        stop_errors += (gui.TkAppClosed,)
 
     args.token = await get_valid_token(args)
 
@@ -212,19 +509,70 @@ async def main():
         logger.error('Не удалось получить токен. Завершение работы.')
         return
 
-    try:
-        async with anyio.create_task_group() as tg:
-            tg.start_soon(gui.draw, messages_queue, sending_queue, status_updates_queue)
+    bus = MessageBus()
+    # окну незачем держать больше, чем оно покажет
+    messages_queue = bus.subscribe('gui', args.max_scrollback, DROP_OLDEST)
+    status_updates_queue = asyncio.Queue()
 
-            tg.start_soon(run_reconnect_loop, args, messages_queue, sending_queue,
-                          status_updates_queue, watchdog_queue, save_history_queue)
+    outbox = worker = None
+    if args.worker_process:
+        from pipeline_worker import PipelineWorker
+        # очередь отправки, журнал и история живут в сетевом процессе, окно передаёт ему введённый текст
+        sending_queue = worker = PipelineWorker(args)
+    else:
+        outbox = Outbox(args.outbox or f'{args.history}.outbox', args.outbox_fsync_interval)
+        sending_queue = OutboundQueue(args.send_queue_size, args.send_queue_policy, outbox)
 
-            tg.start_soon(save_messages, args.history, save_history_queue)
-    except (gui.TkAppClosed, KeyboardInterrupt, ExceptionGroup, asyncio.exceptions.CancelledError):
+    history_pager = load_history(args.history, messages_queue, args.history_tail)
+
+    status_updates_queue.put_nowait(ReadConnectionStateChanged.ESTABLISHED)
+
+    search_index = None
+    if not args.headless and not args.no_search_index:
+        # искать негде, кроме окна: без него индекс только зря перечитывал бы историю
+        search_index = SearchIndex(args.search_index or f'{args.history}.search.sqlite', args.history)
+
+    try:
+        async with search_index or contextlib.nullcontext(), anyio.create_task_group() as tg:
+            if args.headless:
+                tg.start_soon(print_messages, messages_queue)
+                tg.start_soon(read_console_input, sending_queue, status_updates_queue)
+                tg.start_soon(log_status_updates, status_updates_queue)
+            else:
+                tg.start_soon(
+                    partial(
+                        gui.draw, messages_queue, sending_queue, status_updates_queue,
+                        history_pager=history_pager, history_page_size=args.history_page,
+                        max_lines=args.max_scrollback, search_index=search_index
+                    )
+                )
+
+            if worker:
+                tg.start_soon(worker.run, messages_queue, status_updates_queue, search_index)
+                if args.metrics_port and not args.headless:
+                    tg.start_soon(worker.send_metrics, gui.render_metrics)
+            else:
+                start_pipeline(tg, args, bus, sending_queue, outbox, status_updates_queue,
+                               on_commit=search_index.notify if search_index else None)
+    except stop_errors:
         logger.info('Приложение завершено пользователем.')
+    except BaseExceptionGroup as group:
+        # из группы задач выход пользователя тоже приходит завёрнутым; всё прочее в ней — настоящая ошибка
+        _, rest = group.split(stop_errors)
+        if rest is None:
+            logger.info('Приложение завершено пользователем.')
+        else:
+            logger.error(f'Программа завершилась с критической ошибкой: {rest!r}', exc_info=rest)
     except Exception as e:
         logger.exception(f'Программа завершилась с критической ошибкой: {e}')
+    finally:
+        if worker:
+            worker.close()
+        if outbox:
+            outbox.close()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    load_dotenv()
+    args = parse_args()
+    event_loop.run(main(args), args.loop)
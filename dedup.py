@@ -0,0 +1,91 @@
+import logging
+from collections import deque
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 512
+# повтор сервер шлёт сразу после подключения; придержанная строка дольше этого не ждёт продолжения
+HOLD_TIMEOUT = 0.5
+
+suppressed_messages = REGISTRY.counter(
+    'minechat_replayed_suppressed_total', 'Повторы, выброшенные после переподключения', ('reader',)
+)
+
+
+class ReplayFilter:
+    # Сервер при подключении повторяет последние строки: они совпадают с концом окна недавних строк.
+    # Повтором считается только серия, которая дошла до самого хвоста окна. Пока серия не дошла, её строки
+    # придерживаются, а если она оборвалась раньше — отдаются дальше как новые.
+    # В окне только хэши, так что память постоянна, а вне переподключения проверка — одно добавление в deque
+    def __init__(self, name, window=DEFAULT_WINDOW):
+        self.name = name
+        self.suppressed = 0
+        self._recent = deque(maxlen=window)
+        self._snapshot = None
+        self._candidates = None
+        self._held = []
+        self._complete = 0
+        self._counter = suppressed_messages.labels(name)
+
+    @property
+    def holding(self):
+        return bool(self._held)
+
+    def reconnected(self):
+        # Связь оборвалась посреди серии: подтверждённая часть придержанного — повтор, остальное — новые строки,
+        # их возвращаем, чтобы показать и записать. Окно снимаем уже с ними
+        released = self._finish() if self._held else []
+        self._snapshot = list(self._recent) if self._recent else None
+        return released
+
+    def feed(self, message):
+        # возвращает сообщения, которые можно отдавать дальше, в исходном порядке
+        if self._snapshot is None:
+            self._recent.append(hash(message.raw))
+            return [message]
+        return self._match(message)
+
+    def release(self):
+        # серия затихла, не дойдя до хвоста окна: придержанное — новые строки
+        return self._finish()
+
+    def _match(self, message):
+        snapshot = self._snapshot
+        digest = hash(message.raw)
+        if self._candidates is None:
+            # первая строка после подключения: любое её вхождение в окне может быть началом повтора
+            candidates = [position for position, recent in enumerate(snapshot) if recent == digest]
+        else:
+            candidates = [position + 1 for position in self._candidates
+                          if position + 1 < len(snapshot) and snapshot[position + 1] == digest]
+
+        if not candidates:
+            return self._finish([message])
+
+        self._held.append(message)
+        if candidates[-1] == len(snapshot) - 1:
+            # одна из серий дошла до хвоста: всё придержанное — точно повтор. Более длинные серии ещё могут
+            # продолжиться, поэтому ждём их, но дальше этой точки повтор уже подтверждён
+            self._complete = len(self._held)
+            candidates.pop()
+        if not candidates:
+            return self._finish()
+        self._candidates = candidates
+        return []
+
+    def _finish(self, tail=()):
+        replayed, released = self._held[:self._complete], self._held[self._complete:]
+        released.extend(tail)
+        if replayed:
+            self.suppressed += len(replayed)
+            self._counter.inc(len(replayed))
+            logger.info(f'{self.name}: после переподключения пропущено повторов: {len(replayed)}')
+        for message in released:
+            self._recent.append(hash(message.raw))
+        self._snapshot = None
+        self._candidates = None
+        self._held = []
+        self._complete = 0
+        return released
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+AUTO = 'auto'
+ASYNCIO = 'asyncio'
+UVLOOP = 'uvloop'
+LOOPS = (AUTO, ASYNCIO, UVLOOP)
+
+
+def add_loop_argument(parser):
+    parser.add_argument('--loop', default=AUTO, choices=LOOPS, env_var='MINECHAT_LOOP',
+                        help='Цикл событий: uvloop, стандартный asyncio или auto — uvloop, если он установлен')
+
+
+def get_loop_factory(name):
+    if name == ASYNCIO:
+        return ASYNCIO, None
+    try:
+        import uvloop
+    except ImportError:
+        if name == UVLOOP:
+            logger.warning('uvloop не установлен (pip install uvloop), работаю на стандартном цикле asyncio')
+        return ASYNCIO, None
+    return UVLOOP, uvloop.new_event_loop
+
+
+def run(main, loop):
+    # loop — уже разобранный --loop: настройки читаются один раз, до запуска цикла
+    name, loop_factory = get_loop_factory(loop)
+    logger.debug(f'Цикл событий: {name}')
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(main)
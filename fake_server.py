@@ -0,0 +1,217 @@
+import asyncio
+import itertools
+import json
+import logging
+import random
+import uuid
+from collections import deque
+
+import configargparse
+
+logger = logging.getLogger(__name__)
+
+GREETING = 'Hello %username%! Enter your personal hash or leave it empty to create new account.\n'
+NICKNAME_PROMPT = 'Enter preferred nickname below:\n'
+WELCOME = 'Welcome to chat! Post your message below. End it with an empty line.\n'
+MESSAGE_ACCEPTED = 'Message send. Write more, end message with an empty line.\n'
+
+MAX_CLIENT_BUFFER = 4 * 1024 * 1024
+
+
+class FakeMinechatServer:
+    def __init__(self, host='127.0.0.1', read_port=5000, write_port=5050, message_rate=0.0,
+                 latency=0.0, disconnect_interval=0.0, replay=10, accept_any_token=True):
+        self.host = host
+        self.read_port = read_port
+        self.write_port = write_port
+        self.message_rate = message_rate
+        self.latency = latency
+        self.disconnect_interval = disconnect_interval
+        self.accept_any_token = accept_any_token
+
+        self.accounts = {}
+        self.readers = set()
+        self.writers = set()
+        self.recent = deque(maxlen=replay)
+        self.broadcasted = 0
+
+        self._servers = []
+        self._tasks = []
+
+    async def start(self):
+        read_server = await asyncio.start_server(self._handle_reader, self.host, self.read_port)
+        write_server = await asyncio.start_server(self._handle_writer, self.host, self.write_port)
+        self._servers = [read_server, write_server]
+        # порт 0 означает «любой свободный»: узнаём, какой достался
+        self.read_port = read_server.sockets[0].getsockname()[1]
+        self.write_port = write_server.sockets[0].getsockname()[1]
+
+        if self.message_rate:
+            self._tasks.append(asyncio.create_task(self._run_chatter()))
+        if self.disconnect_interval:
+            self._tasks.append(asyncio.create_task(self._run_disconnects()))
+
+        logger.info(f'Тестовый сервер слушает {self.host}: чтение {self.read_port}, отправка {self.write_port}')
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for server in self._servers:
+            server.close()
+        self.disconnect_all()
+        for server in self._servers:
+            await server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def register(self, nickname):
+        token = str(uuid.uuid4())
+        self.accounts[token] = nickname
+        return {'nickname': nickname, 'account_hash': token}
+
+    def broadcast(self, line):
+        data = f'{line}\n'.encode()
+        if self.latency:
+            asyncio.get_running_loop().call_later(self.latency, self._deliver, data)
+        else:
+            self._deliver(data)
+
+    def disconnect_all(self):
+        for writer in list(self.readers) + list(self.writers):
+            writer.transport.abort()
+
+    def _deliver(self, data):
+        self.recent.append(data)
+        self.broadcasted += 1
+        for writer in list(self.readers):
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                # медленный клиент: сервер его отключает, а не копит память
+                writer.transport.abort()
+                self.readers.discard(writer)
+                continue
+            writer.write(data)
+
+    async def _handle_reader(self, reader, writer):
+        for data in self.recent:
+            writer.write(data)
+        self.readers.add(writer)
+        try:
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.readers.discard(writer)
+            writer.close()
+
+    async def _handle_writer(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            await self._reply(writer, GREETING)
+            token = (await reader.readline()).decode().strip()
+
+            if not token:
+                await self._reply(writer, NICKNAME_PROMPT)
+                nickname = (await reader.readline()).decode().strip()
+                account = self.register(nickname)
+                await self._reply(writer, f'{json.dumps(account)}\n')
+            elif token in self.accounts or self.accept_any_token:
+                nickname = self.accounts.setdefault(token, f'user-{token[:8]}')
+                await self._reply(writer, f'{json.dumps({"nickname": nickname, "account_hash": token})}\n')
+            else:
+                await self._reply(writer, 'null\n')
+                return
+
+            await self._reply(writer, WELCOME)
+            await self._read_messages(reader, writer, nickname)
+        except ConnectionError:
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def _read_messages(self, reader, writer, nickname):
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+
+            text = line.decode(errors='replace').rstrip('\n')
+            if text:
+                lines.append(text)
+                continue
+
+            if lines:
+                self.broadcast(f'{nickname}: {" ".join(lines)}')
+                lines = []
+                writer.write(MESSAGE_ACCEPTED.encode())
+
+    async def _reply(self, writer, text):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(text.encode())
+        await writer.drain()
+
+    async def _run_chatter(self):
+        interval = 1 / self.message_rate
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        for number in itertools.count():
+            self.broadcast(f'bot: сообщение номер {number}')
+            # догоняем расписание, а не спим фиксированный интервал, чтобы темп не плыл
+            delay = started_at + (number + 1) * interval - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif number % 1000 == 0:
+                await asyncio.sleep(0)
+
+    async def _run_disconnects(self):
+        while True:
+            await asyncio.sleep(self.disconnect_interval * random.uniform(0.5, 1.5))
+            logger.info('Обрываем все соединения')
+            self.disconnect_all()
+
+
+def get_args():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес, на котором слушать')
+    parser.add_argument('--port', default=5000, type=int, help='Порт чтения чата')
+    parser.add_argument('--write-port', default=5050, type=int, help='Порт отправки сообщений')
+    parser.add_argument('--message-rate', default=0.0, type=float, help='Сколько сообщений в секунду пишет бот')
+    parser.add_argument('--latency', default=0.0, type=float, help='Задержка доставки и ответов, сек')
+    parser.add_argument('--disconnect-interval', default=0.0, type=float,
+                        help='Обрывать все соединения примерно раз в столько секунд')
+    parser.add_argument('--replay', default=10, type=int, help='Сколько последних сообщений отдавать при подключении')
+    return parser.parse_args()
+
+
+async def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='{levelname} - {name} - {message}',
+        style='{'
+    )
+
+    args = get_args()
+    server = FakeMinechatServer(
+        args.host, args.port, args.write_port,
+        message_rate=args.message_rate,
+        latency=args.latency,
+        disconnect_interval=args.disconnect_interval,
+        replay=args.replay
+    )
+    async with server:
+        await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -1,69 +1,272 @@
+import _tkinter
 import asyncio
+import itertools
+import time
 import tkinter as tk
-from enum import Enum
 from tkinter.scrolledtext import ScrolledText
 
+from async_timeout import timeout
 
-class TkAppClosed(Exception):
-    pass
+from metrics import REGISTRY
+from statuses import (MentionFound, NicknameReceived, ReadConnectionStateChanged, SendingConnectionStateChanged,
+                      SendingQueueOverflow)
 
 
-class ReadConnectionStateChanged(Enum):
-    INITIATED = 'устанавливаем соединение'
-    ESTABLISHED = 'соединение установлено'
-    CLOSED = 'соединение закрыто'
+DEFAULT_MAX_LINES = 10000
+# пока пользователь листает вверх, окно держит до стольких max_lines, а лишнее срезает вне видимой части
+SCROLLED_LIMIT_FACTOR = 2
+MENTION_TAG = 'mention'
+INPUT_EVENTS = ('<Key>', '<Button>', '<MouseWheel>', '<Motion>', '<Configure>')
 
-    def __str__(self):
-        return str(self.value)
+render_latency = REGISTRY.histogram('minechat_gui_render_seconds', 'Время одной вставки сообщений в окно чата')
+rendered_messages = REGISTRY.counter('minechat_gui_rendered_messages_total', 'Показано сообщений в окне чата')
+display_lag = REGISTRY.histogram('minechat_gui_display_lag_seconds', 'Время от приёма сообщения до показа в окне',
+                                 (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+GUI_METRICS = (render_latency, rendered_messages, display_lag)
 
 
-class SendingConnectionStateChanged(Enum):
-    INITIATED = 'устанавливаем соединение'
-    ESTABLISHED = 'соединение установлено'
-    CLOSED = 'соединение закрыто'
+class TkAppClosed(Exception):
+    pass
 
-    def __str__(self):
-        return str(self.value)
 
+def process_new_message(input_field, sending_queue, status_updates_queue=None):
+    text = input_field.get()
+    try:
+        dropped = sending_queue.put_nowait(text)
+    except asyncio.QueueFull:
+        # текст остаётся в поле ввода: его можно отправить ещё раз, когда очередь разгрузится
+        if status_updates_queue:
+            status_updates_queue.put_nowait(SendingQueueOverflow(sending_queue.qsize()))
+        return
+    if dropped is not None and status_updates_queue:
+        status_updates_queue.put_nowait(SendingQueueOverflow(sending_queue.qsize(), dropped))
+    input_field.delete(0, tk.END)
 
-class NicknameReceived:
-    def __init__(self, nickname):
-        self.nickname = nickname
 
+class TkPump:
+    def __init__(self, widget, active_interval=1 / 120, idle_interval=1 / 20, idle_after=0.5):
+        self.widget = widget
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.idle_after = idle_after
+        self._last_activity = time.monotonic()
+        self._wakeup = asyncio.Event()
 
-def process_new_message(input_field, sending_queue):
-    text = input_field.get()
-    sending_queue.put_nowait(text)
-    input_field.delete(0, tk.END)
+    def poke(self):
+        # есть работа для отрисовки: крутимся на высокой частоте без ожидания
+        self._last_activity = time.monotonic()
+        self._wakeup.set()
 
+    def watch_input(self, widget):
+        # Активность — это ввод пользователя и новые данные (poke), а не всякое событие Tk: мигание курсора
+        # в поле ввода — тоже событие таймера, и окно с фокусом на вводе иначе никогда бы не затихало
+        for sequence in INPUT_EVENTS:
+            widget.bind_all(sequence, self._on_input, add='+')
 
-async def update_tk(root_frame, interval=1 / 120):
-    while True:
+    def _on_input(self, event):
+        self._last_activity = time.monotonic()
+
+    def process_events(self):
         try:
-            root_frame.update()
+            while self.widget.tk.dooneevent(_tkinter.ALL_EVENTS | _tkinter.DONT_WAIT):
+                pass
+            self.widget.update_idletasks()
         except tk.TclError:
             # if application has been destroyed/closed
             raise TkAppClosed()
-        await asyncio.sleep(interval)
 
+    async def step(self):
+        self.process_events()
+
+        is_idle = time.monotonic() - self._last_activity > self.idle_after
+        interval = self.idle_interval if is_idle else self.active_interval
+
+        self._wakeup.clear()
+        try:
+            async with timeout(interval):
+                await self._wakeup.wait()
+        except asyncio.TimeoutError:
+            pass
 
-async def update_conversation_history(panel, messages_queue):
+    async def run(self):
+        while True:
+            await self.step()
+
+
+async def update_tk(pump):
+    await pump.run()
+
+
+def drain_queue(queue, first_item):
+    items = [first_item]
     while True:
-        msg = await messages_queue.get()
-
-        panel['state'] = 'normal'
-        if panel.index('end-1c') != '1.0':
-            panel.insert('end', '\n')
-        panel.insert('end', msg)
-        # TODO сделать промотку умной, чтобы не мешала просматривать историю сообщений
-        # ScrolledText.frame
-        # ScrolledText.vbar
+        try:
+            items.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            return items
+
+
+def render_messages(panel, messages, max_lines=DEFAULT_MAX_LINES, on_trim=None):
+    # Промотка умная: следим за концом чата, только если пользователь и так внизу
+    follow_tail = panel.yview()[1] >= 1.0
+    skipped = 0
+    if follow_tail and len(messages) > max_lines:
+        skipped = len(messages) - max_lines
+        messages = messages[skipped:]
+
+    panel['state'] = 'normal'
+    text = '\n'.join(map(str, messages))
+    first_line = 1
+    if panel.index('end-1c') != '1.0':
+        text = '\n' + text
+        first_line = int(panel.index('end-1c').split('.')[0]) + 1
+    panel.insert('end', text)
+    # строки из истории — просто текст, подсвечиваем только сообщения с найденными упоминаниями
+    for number, message in enumerate(messages, first_line):
+        if getattr(message, 'mentions', None):
+            panel.tag_add(MENTION_TAG, f'{number}.0', f'{number}.end')
+
+    if follow_tail:
+        # Лишние строки срезаем только внизу, чтобы не отнимать у читающего историю подгруженные страницы
+        lines_count = int(panel.index('end-1c').split('.')[0])
+        excess = lines_count - max_lines
+        if excess > 0:
+            panel.delete('1.0', f'{excess + 1}.0')
+        if on_trim and excess + skipped > 0:
+            on_trim(max(excess, 0) + skipped)
         panel.yview(tk.END)
-        panel['state'] = 'disabled'
+    else:
+        trim_outside_view(panel, max_lines * SCROLLED_LIMIT_FACTOR, on_trim)
+    panel['state'] = 'disabled'
+
+
+def trim_outside_view(panel, limit, on_trim=None):
+    # Пока пользователь листает вверх, окно тоже не растёт без предела: срезаем то, чего он не видит —
+    # сперва строки над видимой частью, остальное снизу (эти сообщения остаются в файле истории)
+    lines_count = int(panel.index('end-1c').split('.')[0])
+    excess = lines_count - limit
+    if excess <= 0:
+        return
+
+    top_line = int(panel.index('@0,0').split('.')[0])
+    cut_top = min(excess, top_line - 1)
+    cut_bottom = excess - cut_top
+    if cut_bottom:
+        panel.delete(f'{lines_count - cut_bottom}.end', 'end-1c')
+    if cut_top:
+        panel.delete('1.0', f'{cut_top + 1}.0')
+        if on_trim:
+            on_trim(cut_top)
+    # перед глазами остаётся та же строка, что и до среза
+    panel.yview(f'{top_line - cut_top}.0')
+
+
+def render_metrics():
+    # в режиме --worker-process метрики отдаёт сетевой процесс: окно шлёт ему снимок своих
+    return [line for metric in GUI_METRICS for line in metric.render()]
+
+
+def observe_display_lag(messages):
+    # у строк одной пачки чтения одно время приёма: одно наблюдение на пачку, а не на каждое сообщение.
+    # Строки из истории — просто текст без времени приёма, их пропускаем
+    now = time.time()
+    for received_at, group in itertools.groupby(messages, key=lambda message: getattr(message, 'received_at', None)):
+        if received_at is not None:
+            display_lag.observe(now - received_at, sum(1 for _ in group))
+
+
+async def update_conversation_history(panel, messages_queue, max_lines=DEFAULT_MAX_LINES,
+                                      on_trim=None, frame_interval=1 / 60, pump=None):
+    while True:
+        first_message = await messages_queue.get()
+        messages = drain_queue(messages_queue, first_message)
+        started_at = time.monotonic()
+        render_messages(panel, messages, max_lines, on_trim)
+        render_latency.observe(time.monotonic() - started_at)
+        rendered_messages.inc(len(messages))
+        observe_display_lag(messages)
+        if pump:
+            pump.poke()
+        # не чаще одной отрисовки за кадр: всё, что придёт за это время, уйдёт одной вставкой
+        await asyncio.sleep(frame_interval)
+
+
+def load_older_history(panel, history_pager, page_size):
+    lines = history_pager.load_older(page_size)
+    if not lines:
+        return
+
+    panel['state'] = 'normal'
+    if panel.index('end-1c') != '1.0':
+        panel.insert('1.0', '\n')
+    panel.insert('1.0', '\n'.join(lines))
+    panel['state'] = 'disabled'
+    # оставляем перед глазами ту же строку, что была наверху до подгрузки
+    panel.yview(f'{len(lines) + 1}.0')
+
+
+def watch_scroll_to_top(panel, history_pager, page_size):
+    scheduled = False
+
+    def load_page():
+        nonlocal scheduled
+        scheduled = False
+        load_older_history(panel, history_pager, page_size)
 
+    def on_scroll(first, last):
+        nonlocal scheduled
+        panel.vbar.set(first, last)
+        if float(first) <= 0 and not history_pager.exhausted and not scheduled:
+            scheduled = True
+            panel.after_idle(load_page)
 
-async def update_status_panel(status_labels, status_updates_queue):
-    nickname_label, read_label, write_label = status_labels
+    panel['yscrollcommand'] = on_scroll
+
+
+def create_search_panel(root_frame, search_queue):
+    search_frame = tk.Frame(root_frame)
+    search_frame.pack(side="top", fill=tk.X)
+
+    search_field = tk.Entry(search_frame)
+    search_field.pack(side="left", fill=tk.X, expand=True)
+    search_field.bind("<Return>", lambda event: search_queue.put_nowait(search_field.get()))
+
+    search_button = tk.Button(search_frame)
+    search_button["text"] = "Найти"
+    search_button["command"] = lambda: search_queue.put_nowait(search_field.get())
+    search_button.pack(side="left")
+
+    results_panel = ScrolledText(root_frame, wrap='none', height=8)
+    return (search_frame, results_panel)
+
+
+async def update_search_results(search_panel, search_queue, search_index, pump=None):
+    search_frame, results_panel = search_panel
+
+    while True:
+        query = await search_queue.get()
+        results = await search_index.search(query) if query.strip() else []
+
+        if not query.strip():
+            results_panel.pack_forget()
+        else:
+            results_panel.pack(side="top", fill=tk.X, after=search_frame)
+
+        results_panel['state'] = 'normal'
+        results_panel.delete('1.0', tk.END)
+        if results:
+            results_panel.insert('end', '\n'.join(reversed(results)))
+            results_panel.yview(tk.END)
+        else:
+            results_panel.insert('end', 'Ничего не найдено')
+        results_panel['state'] = 'disabled'
+
+        if pump:
+            pump.poke()
+
+
+async def update_status_panel(status_labels, status_updates_queue, pump=None):
+    nickname_label, read_label, write_label, mention_label = status_labels
 
     read_label['text'] = f'Чтение: нет соединения'
     write_label['text'] = f'Отправка: нет соединения'
@@ -74,12 +277,19 @@ async def update_status_panel(status_labels, status_updates_queue):
         if isinstance(msg, ReadConnectionStateChanged):
             read_label['text'] = f'Чтение: {msg}'
 
-        if isinstance(msg, SendingConnectionStateChanged):
+        if isinstance(msg, (SendingConnectionStateChanged, SendingQueueOverflow)):
             write_label['text'] = f'Отправка: {msg}'
 
         if isinstance(msg, NicknameReceived):
             nickname_label['text'] = f'Имя пользователя: {msg.nickname}'
 
+        if isinstance(msg, MentionFound):
+            mention_label['text'] = f'Упоминание: {msg}'
+            mention_label.bell()
+
+        if pump:
+            pump.poke()
+
 
 def create_status_panel(root_frame):
     status_frame = tk.Frame(root_frame)
@@ -97,10 +307,13 @@ def create_status_panel(root_frame):
     status_write_label = tk.Label(connections_frame, height=1, fg='grey', font='arial 10', anchor='w')
     status_write_label.pack(side="top", fill=tk.X)
 
-    return (nickname_label, status_read_label, status_write_label)
+    mention_label = tk.Label(connections_frame, height=1, fg='dark orange', font='arial 10', anchor='w')
+    mention_label.pack(side="top", fill=tk.X)
+
+    return (nickname_label, status_read_label, status_write_label, mention_label)
 
 
-async def draw(messages_queue, sending_queue, status_updates_queue):
+def create_main_window(sending_queue, status_updates_queue, search_queue=None):
     root = tk.Tk()
 
     root.title('Чат Майнкрафтера')
@@ -116,18 +329,45 @@ async def draw(messages_queue, sending_queue, status_updates_queue):
     input_field = tk.Entry(input_frame)
     input_field.pack(side="left", fill=tk.X, expand=True)
 
-    input_field.bind("<Return>", lambda event: process_new_message(input_field, sending_queue))
+    input_field.bind("<Return>", lambda event: process_new_message(input_field, sending_queue, status_updates_queue))
 
     send_button = tk.Button(input_frame)
     send_button["text"] = "Отправить"
-    send_button["command"] = lambda: process_new_message(input_field, sending_queue)
+    send_button["command"] = lambda: process_new_message(input_field, sending_queue, status_updates_queue)
     send_button.pack(side="left")
 
+    search_panel = None
+    if search_queue is not None:
+        search_panel = create_search_panel(root_frame, search_queue)
+
     conversation_panel = ScrolledText(root_frame, wrap='none')
     conversation_panel.pack(side="top", fill="both", expand=True)
+    conversation_panel.tag_config(MENTION_TAG, background='#fff2a8')
+
+    return root, root_frame, input_field, status_labels, search_panel, conversation_panel
+
+
+async def draw(messages_queue, sending_queue, status_updates_queue,
+               history_pager=None, history_page_size=200, max_lines=DEFAULT_MAX_LINES, search_index=None):
+    search_queue = asyncio.Queue() if search_index else None
+    root, root_frame, _, status_labels, search_panel, conversation_panel = create_main_window(
+        sending_queue, status_updates_queue, search_queue
+    )
+
+    on_trim = None
+    if history_pager:
+        watch_scroll_to_top(conversation_panel, history_pager, history_page_size)
+        on_trim = history_pager.forget_oldest
+
+    pump = TkPump(root_frame)
+    pump.watch_input(root)
+
+    coroutines = [
+        update_tk(pump),
+        update_conversation_history(conversation_panel, messages_queue, max_lines, on_trim, pump=pump),
+        update_status_panel(status_labels, status_updates_queue, pump=pump),
+    ]
+    if search_index:
+        coroutines.append(update_search_results(search_panel, search_queue, search_index, pump=pump))
 
-    await asyncio.gather(
-        update_tk(root_frame),
-        update_conversation_history(conversation_panel, messages_queue),
-        update_status_panel(status_labels, status_updates_queue)
-    )
\ No newline at end of file
+    await asyncio.gather(*coroutines)
\ No newline at end of file
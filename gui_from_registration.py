@@ -5,6 +5,8 @@ from tkinter import messagebox
 
 import aiofiles
 
+from gui import TkAppClosed, TkPump
+
 
 async def register_at_server(host, port, nickname):
     reader, writer = await asyncio.open_connection(host, port)
@@ -59,10 +61,12 @@ async def run_registration_process():
     registration_queue = asyncio.Queue()
 
     root = create_registration_ui(registration_queue)
+    pump = TkPump(root)
+    pump.watch_input(root)
 
     while True:
-        root.update()
         try:
+            await pump.step()
             nickname = registration_queue.get_nowait()
             account = await register_at_server(host, port, nickname)
             token = account['account_hash']
@@ -72,8 +76,8 @@ async def run_registration_process():
             messagebox.showinfo("Успех!", f"Регистрация прошла! Токен сохранен.\nТвой ник: {account['nickname']}")
             break
         except asyncio.QueueEmpty:
-            await asyncio.sleep(0.01)
-        except tk.TclError:
+            continue
+        except (tk.TclError, TkAppClosed):
             break
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось зарегистрироваться: {e}")
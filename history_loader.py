@@ -0,0 +1,141 @@
+import mmap
+import os
+from contextlib import contextmanager
+
+from history_storage import load_manifest, read_segment
+
+DEFAULT_TAIL_SIZE = 200
+DEFAULT_PAGE_SIZE = 200
+
+
+@contextmanager
+def map_file(file_path):
+    try:
+        f = open(file_path, 'rb')
+    except FileNotFoundError:
+        yield b''
+        return
+
+    with f:
+        if not os.fstat(f.fileno()).st_size:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+
+class HistoryPager:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        # Смещение первого байта самой старой показанной строки внутри текущего источника
+        self.start = 0
+        # Источник — активный файл (None) или закрытый сегмент, опознаём по номеру из манифеста
+        self._source_sequence = None
+        self._active_sequence = None
+        self._segment_data = None
+
+    @property
+    def exhausted(self):
+        return self.start == 0 and self._older_segment() is None
+
+    def load_tail(self, count):
+        self._switch_to(None)
+        try:
+            self.start = os.path.getsize(self.file_path)
+        except OSError:
+            self.start = 0
+        return self.load_older(count)
+
+    def load_older(self, count):
+        lines = []
+        while len(lines) < count:
+            with self._open_source() as data:
+                end = min(self.start, len(data))
+                while end > 0 and len(lines) < count:
+                    content_end = end - 1 if data[end - 1] == ord('\n') else end
+                    line_start = data.rfind(b'\n', 0, content_end) + 1
+                    line = data[line_start:content_end].decode('utf-8', errors='replace').strip()
+                    if line:
+                        lines.append(line)
+                    end = line_start
+            self.start = end
+
+            if self.start:
+                break
+            older_segment = self._older_segment()
+            if older_segment is None:
+                break
+            # текущий источник кончился: листаем дальше в предыдущий сегмент
+            self._switch_to(older_segment['sequence'])
+            self.start = len(self._segment_data)
+
+        lines.reverse()
+        return lines
+
+    def forget_oldest(self, count):
+        while count > 0:
+            with self._open_source() as data:
+                position = self.start
+                while count > 0 and position < len(data):
+                    newline = data.find(b'\n', position)
+                    if newline == -1:
+                        newline = len(data)
+                    if data[position:newline].strip():
+                        count -= 1
+                    position = newline + 1
+                self.start = min(position, len(data))
+
+            newer_sequence = self._newer_source_sequence()
+            if count <= 0 or newer_sequence is False:
+                break
+            self._switch_to(newer_sequence)
+            self.start = 0
+
+    def _switch_to(self, sequence):
+        self._source_sequence = sequence
+        self._segment_data = None
+        if sequence is None:
+            self._active_sequence = load_manifest(self.file_path)['active_sequence']
+        else:
+            segment = self._find_segment(sequence)
+            self._segment_data = read_segment(self.file_path, segment) if segment else b''
+
+    @contextmanager
+    def _open_source(self):
+        if self._source_sequence is None:
+            active_sequence = load_manifest(self.file_path)['active_sequence']
+            if active_sequence != self._active_sequence:
+                # активный файл ротировали: то, что мы листали, теперь лежит в сегменте под его номером
+                self._switch_to(self._active_sequence)
+                self._active_sequence = active_sequence
+
+        if self._source_sequence is not None:
+            yield self._segment_data
+            return
+        with map_file(self.file_path) as mm:
+            yield mm
+
+    def _find_segment(self, sequence):
+        for segment in load_manifest(self.file_path)['segments']:
+            if segment['sequence'] == sequence:
+                return segment
+        return None
+
+    def _older_segment(self):
+        segments = load_manifest(self.file_path)['segments']
+        if self._source_sequence is None:
+            return segments[-1] if segments else None
+        sequences = [segment['sequence'] for segment in segments]
+        if self._source_sequence not in sequences:
+            return None
+        position = sequences.index(self._source_sequence)
+        return segments[position - 1] if position else None
+
+    def _newer_source_sequence(self):
+        if self._source_sequence is None:
+            return False
+        sequences = [segment['sequence'] for segment in load_manifest(self.file_path)['segments']]
+        if self._source_sequence not in sequences:
+            return None
+        position = sequences.index(self._source_sequence)
+        return sequences[position + 1] if position + 1 < len(sequences) else None
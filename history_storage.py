@@ -0,0 +1,191 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import configargparse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROTATE_SIZE = 16 * 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def segments_dir(history_path):
+    return f'{history_path}.segments'
+
+
+def manifest_path(history_path):
+    return os.path.join(segments_dir(history_path), 'manifest.json')
+
+
+def load_manifest(history_path):
+    # Сегмент опознаётся по номеру, активный файл — по active_sequence: номеру, под которым он уйдёт в сегмент.
+    # inode для этого не годится: сжатый сегмент удаляется, и файловая система отдаёт его inode новым файлам
+    try:
+        with open(manifest_path(history_path), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'segments': [], 'active_sequence': 1}
+
+    # манифест старого формата: номер берём из имени сегмента
+    for segment in manifest['segments']:
+        segment.pop('inode', None)
+        segment.setdefault('sequence', int(segment['name'].split('-', 1)[0]))
+    if 'active_sequence' not in manifest:
+        manifest['active_sequence'] = manifest.pop('next_sequence')
+    return manifest
+
+
+def save_manifest(history_path, manifest):
+    # пишем рядом и подменяем атомарно: читатели никогда не видят манифест наполовину
+    path = manifest_path(history_path)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+def open_segment(history_path, segment):
+    # сегмент могли сжать между чтением манифеста и открытием, поэтому пробуем оба имени
+    path = os.path.join(segments_dir(history_path), segment['name'])
+    raw_path = path.removesuffix('.gz')
+    try:
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rb')
+        return open(path, 'rb')
+    except FileNotFoundError:
+        if os.path.exists(f'{raw_path}.gz'):
+            return gzip.open(f'{raw_path}.gz', 'rb')
+        return open(raw_path, 'rb')
+
+
+def read_segment(history_path, segment):
+    with open_segment(history_path, segment) as f:
+        return f.read()
+
+
+def iter_history_sources(history_path):
+    # от старых данных к новым: закрытые сегменты по манифесту, затем активный файл; у каждого — его номер
+    manifest = load_manifest(history_path)
+    for segment in manifest['segments']:
+        yield segment['sequence'], lambda segment=segment: open_segment(history_path, segment)
+    if os.path.exists(history_path):
+        yield manifest['active_sequence'], lambda: open(history_path, 'rb')
+
+
+def iter_history_lines(history_path):
+    for _, open_source in iter_history_sources(history_path):
+        with open_source() as f:
+            for line in f:
+                line = line.decode('utf-8', errors='replace').strip()
+                if line:
+                    yield line
+
+
+class SegmentRotator:
+    def __init__(self, history_path, rotate_size=DEFAULT_ROTATE_SIZE, rotate_daily=False, compressor=None):
+        self.history_path = history_path
+        self.rotate_size = rotate_size
+        self.rotate_daily = rotate_daily
+        self.opened_on = date.today()
+        self._manifest_lock = threading.Lock()
+        # в общем пуле два сжатия одной истории не должны идти одновременно
+        self._compress_lock = threading.Lock()
+        # сжатие в своём потоке, чтобы не задерживать запись следующих пачек
+        self._owns_compressor = compressor is None
+        self._compressor = compressor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='history-compress')
+
+    def opened(self, file):
+        if os.fstat(file.fileno()).st_size:
+            self.opened_on = date.fromtimestamp(os.fstat(file.fileno()).st_mtime)
+        else:
+            self.opened_on = date.today()
+        self._compressor.submit(self._compress_pending)
+
+    def should_rotate(self, file, incoming_size):
+        size = file.tell()
+        if not size:
+            return False
+        if self.rotate_size and size + incoming_size > self.rotate_size:
+            return True
+        return self.rotate_daily and date.today() != self.opened_on
+
+    def rotate(self, file):
+        size = file.tell()
+        file.close()
+
+        os.makedirs(segments_dir(self.history_path), exist_ok=True)
+        with self._manifest_lock:
+            manifest = load_manifest(self.history_path)
+            sequence = manifest['active_sequence']
+            name = f'{sequence:06d}-{self.opened_on.isoformat()}.txt'
+            os.replace(self.history_path, os.path.join(segments_dir(self.history_path), name))
+
+            manifest['segments'].append({
+                'name': name,
+                'sequence': sequence,
+                'bytes': size,
+                'opened': self.opened_on.isoformat(),
+                'closed': date.today().isoformat(),
+            })
+            manifest['active_sequence'] = sequence + 1
+            save_manifest(self.history_path, manifest)
+        logger.info(f'История {self.history_path} перенесена в сегмент {name}')
+
+        new_file = open(self.history_path, 'ab')
+        self.opened(new_file)
+        return new_file
+
+    def close(self):
+        if self._owns_compressor:
+            self._compressor.shutdown(wait=True)
+
+    def _compress_pending(self):
+        with self._compress_lock:
+            self._compress_segments()
+
+    def _compress_segments(self):
+        manifest = load_manifest(self.history_path)
+        for segment in manifest['segments']:
+            if segment['name'].endswith('.gz'):
+                continue
+
+            raw_path = os.path.join(segments_dir(self.history_path), segment['name'])
+            try:
+                with open(raw_path, 'rb') as src, gzip.open(f'{raw_path}.gz.tmp', 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, READ_CHUNK_SIZE)
+                os.replace(f'{raw_path}.gz.tmp', f'{raw_path}.gz')
+            except OSError as e:
+                logger.error(f'Не удалось сжать сегмент {raw_path}: {e}')
+                return
+
+            # манифест перечитываем: за время сжатия могли появиться новые сегменты
+            with self._manifest_lock:
+                fresh_manifest = load_manifest(self.history_path)
+                for fresh_segment in fresh_manifest['segments']:
+                    if fresh_segment['name'] == segment['name']:
+                        fresh_segment['name'] = f"{segment['name']}.gz"
+                save_manifest(self.history_path, fresh_manifest)
+            os.remove(raw_path)
+
+
+def get_args():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--history', default='chat_logfile.txt', env_var='MINECHAT_HISTORY', help='Путь к файлу истории')
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    # выгрузка всей истории по порядку: сегменты распаковываются потоково, по одному
+    for line in iter_history_lines(args.history):
+        sys.stdout.write(f'{line}\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_timeout import timeout
+
+from history_storage import DEFAULT_ROTATE_SIZE, SegmentRotator
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 0.2
+
+commit_latency = REGISTRY.histogram('minechat_history_commit_seconds', 'Время записи пачки истории на диск')
+written_bytes = REGISTRY.counter('minechat_history_written_bytes_total', 'Записано байт истории')
+
+
+class HistoryWriter:
+    def __init__(self, file_path, flush_size=DEFAULT_FLUSH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, fsync=False, on_commit=None,
+                 rotate_size=DEFAULT_ROTATE_SIZE, rotate_daily=False, executor=None):
+        self.file_path = file_path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.on_commit = on_commit
+        self.rotator = None
+        if rotate_size or rotate_daily:
+            self.rotator = SegmentRotator(file_path, rotate_size, rotate_daily, compressor=executor)
+
+        self._pending = []
+        self._pending_size = 0
+        self._has_data = asyncio.Event()
+        self._size_reached = asyncio.Event()
+        self._file = None
+        self._flush_task = None
+        self._commit_future = None
+        # Свой поток на писателя, если не дали общий пул: пачки одного писателя всё равно идут
+        # строго по очереди, потому что следующая отправляется только после завершения предыдущей
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='history-writer')
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def open(self):
+        self._file = await asyncio.wrap_future(
+            self._executor.submit(self._open_file)
+        )
+        self._flush_task = asyncio.create_task(self._run())
+
+    def write_line(self, line):
+        self.write_raw(f'{line}\n'.encode())
+
+    def write_raw(self, *chunks):
+        # готовые байты строки, вместе с переводом строки, уходят в пачку без перекодирования
+        self._pending.extend(chunks)
+        for chunk in chunks:
+            self._pending_size += len(chunk)
+
+        self._has_data.set()
+        if self._pending_size >= self.flush_size:
+            self._size_reached.set()
+
+    async def flush(self):
+        batch = self._take_batch()
+        if batch:
+            started_at = time.monotonic()
+            self._commit_future = self._executor.submit(self._commit, batch)
+            await asyncio.wrap_future(self._commit_future)
+            commit_latency.observe(time.monotonic() - started_at)
+            written_bytes.inc(len(batch))
+
+    def close(self):
+        # Вызывается и при отмене задачи, поэтому без await: остаток дописывается синхронно
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+        if self._commit_future:
+            # отменённый flush мог оставить пачку в работе: дописываем остаток только после неё
+            self._commit_future.result()
+            self._commit_future = None
+
+        batch = self._take_batch()
+        if batch and self._file:
+            self._executor.submit(self._commit, batch).result()
+        if self._file:
+            self._executor.submit(self._file.close).result()
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+        self._file = None
+        if self.rotator:
+            self.rotator.close()
+
+    async def _run(self):
+        while True:
+            await self._has_data.wait()
+            try:
+                async with timeout(self.flush_interval):
+                    await self._size_reached.wait()
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def _take_batch(self):
+        batch = b''.join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        self._has_data.clear()
+        self._size_reached.clear()
+        return batch
+
+    def _open_file(self):
+        file = open(self.file_path, 'ab')
+        if self.rotator:
+            self.rotator.opened(file)
+        return file
+
+    def _commit(self, batch):
+        try:
+            if self.rotator and self.rotator.should_rotate(self._file, len(batch)):
+                self._file = self.rotator.rotate(self._file)
+            self._file.write(batch)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError as e:
+            logger.error(f'Не удалось записать историю в {self.file_path}: {e}')
+            return
+
+        if self.on_commit:
+            self.on_commit(batch)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_LINE_SIZE = 1024 * 1024
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_HIGH_WATER = 4096
+
+
+class LineProtocol(asyncio.BufferedProtocol):
+    # Ядро пишет прямо в наш буфер, а строки режутся сразу пачкой: одна операция recv — много строк
+    def __init__(self, max_line_size=DEFAULT_MAX_LINE_SIZE, buffer_size=DEFAULT_BUFFER_SIZE,
+                 high_water=DEFAULT_HIGH_WATER):
+        self.max_line_size = max_line_size
+        self.high_water = high_water
+        self.oversized = 0
+
+        self._buffer = bytearray(buffer_size)
+        self._start = 0
+        self._end = 0
+        self._scanned = 0
+        # Хвост слишком длинной строки: отдали её начало, остальное до перевода строки выбрасываем
+        self._discarding = False
+
+        self._lines = deque()
+        self._waiter = None
+        self._transport = None
+        self._paused = False
+        self._eof = False
+        self._exception = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def get_buffer(self, sizehint):
+        if self._start:
+            # сдвигаем недочитанный хвост в начало, чтобы буфер не рос от строки к строке
+            pending = self._end - self._start
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+            self._scanned -= self._start
+            self._start, self._end = 0, pending
+
+        if self._end == len(self._buffer):
+            # недочитанная строка не длиннее предела (длиннее режет buffer_updated), так что буферу хватает
+            # max_line_size + 1 байт: место под перевод строки
+            self._buffer.extend(bytes(min(len(self._buffer), self.max_line_size + 1 - len(self._buffer))))
+        return memoryview(self._buffer)[self._end:]
+
+    def buffer_updated(self, nbytes):
+        self._end += nbytes
+        buffer = self._buffer
+        max_line_size = self.max_line_size
+        newline = buffer.find(b'\n', self._scanned, self._end)
+        with memoryview(buffer) as view:
+            while newline != -1:
+                if self._discarding:
+                    self._discarding = False
+                elif newline - self._start > max_line_size:
+                    self._cut_oversized_line(view[self._start:self._start + max_line_size])
+                else:
+                    self._lines.append(view[self._start:newline + 1].tobytes())
+                self._start = newline + 1
+                newline = buffer.find(b'\n', self._start, self._end)
+
+            if not self._discarding and self._end - self._start > max_line_size:
+                # перевода строки ещё нет, а предел уже превышен: отдаём начало, остальное выбросим
+                self._cut_oversized_line(view[self._start:self._start + max_line_size])
+                self._discarding = True
+        self._scanned = self._end
+
+        if self._discarding:
+            self._start = self._scanned = self._end = 0
+
+        if len(self._lines) >= self.high_water and not self._paused:
+            # потребитель не успевает: перестаём читать сокет, пусть ждёт ядро, а не наша память
+            self._paused = True
+            self._transport.pause_reading()
+        self._wake()
+
+    def eof_received(self):
+        self._eof = True
+        self._wake()
+        return False
+
+    def connection_lost(self, exc):
+        self._eof = True
+        self._exception = exc
+        self._wake()
+
+    async def read_batch(self):
+        while not self._lines:
+            if self._eof:
+                if self._exception:
+                    raise self._exception
+                return []
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+        lines = list(self._lines)
+        self._lines.clear()
+        if self._paused:
+            self._paused = False
+            self._transport.resume_reading()
+        return lines
+
+    def close(self):
+        if self._transport:
+            self._transport.close()
+
+    def _cut_oversized_line(self, head):
+        self.oversized += 1
+        logger.warning(f'Строка длиннее {self.max_line_size} байт обрезана')
+        self._lines.append(head.tobytes() + b'\n')
+
+    def _wake(self):
+        if self._waiter and not self._waiter.done():
+            self._waiter.set_result(None)
+
+
+async def open_line_connection(host, port, **protocol_options):
+    loop = asyncio.get_running_loop()
+    _, protocol = await loop.create_connection(lambda: LineProtocol(**protocol_options), host, port)
+    return protocol
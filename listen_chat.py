@@ -1,51 +1,168 @@
 import asyncio
 import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 
-import aiofiles
+import anyio
 import configargparse
+from async_timeout import timeout
 from dotenv import load_dotenv
 
+import event_loop
+from dedup import DEFAULT_WINDOW, HOLD_TIMEOUT, ReplayFilter
+from history_storage import DEFAULT_ROTATE_SIZE
+from history_writer import DEFAULT_FLUSH_INTERVAL, DEFAULT_FLUSH_SIZE, HistoryWriter
+from line_reader import DEFAULT_MAX_LINE_SIZE, open_line_connection
+from log_setup import Lazy, add_logging_arguments, setup_logging
+from messages import ChatMessage, timestamp_prefix
+from metrics import REGISTRY, serve_metrics
+from reconnect import ChannelState, ResolverCache, supervise_channel
+from search_index import SearchIndex
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_WRITER_THREADS = 4
+DEFAULT_STATS_INTERVAL = 60.0
 
-async def watch_chat(host, port, logfile):
 
-    while True:
-        writer = None
-        try:
-            reader, writer = await asyncio.open_connection(host, port)
+class Endpoint:
+    def __init__(self, host, port, history, dedup_window=DEFAULT_WINDOW):
+        self.host = host
+        self.port = port
+        self.history = history
+        self.name = f'{host}:{port}'
+        self.channel = ChannelState(self.name)
+        self.replay_filter = ReplayFilter(self.name, dedup_window) if dedup_window else None
+        self.messages = 0
+        self.bytes = 0
+
+    @property
+    def suppressed(self):
+        return self.replay_filter.suppressed if self.replay_filter else 0
+
+
+def parse_endpoint(spec, default_port, default_history, dedup_window=DEFAULT_WINDOW):
+    # host[:port][=файл истории]; без файла история пишется рядом с общей, с адресом в имени
+    address, _, history = spec.partition('=')
+    host, _, port = address.partition(':')
+    port = int(port) if port else default_port
+    if not history:
+        root, extension = os.path.splitext(default_history)
+        history = f'{root}.{host}-{port}{extension}'
+    return Endpoint(host, port, history, dedup_window)
 
-            timestamp = datetime.now().strftime('%d.%m.%y %H:%M')
-            msg = f'[{timestamp}] Установлено соединение\n'
-            logger.info(msg.strip())
 
-            async with aiofiles.open(logfile, mode='a', encoding='utf-8') as f:
-                await f.write(msg)
-                await f.flush()
+def save_message(endpoint, history, message):
+    history.write_raw(timestamp_prefix(message.received_at), message.line)
+    endpoint.messages += 1
+    endpoint.bytes += len(message.raw)
+
+    logger.info('%s: %s', endpoint.name, Lazy(message.format_history))
+
+
+async def read_endpoint(address, endpoint, history, max_line_size=DEFAULT_MAX_LINE_SIZE):
+    connection = await open_line_connection(address, endpoint.port, max_line_size=max_line_size)
+    try:
+        endpoint.channel.established()
+        if endpoint.replay_filter:
+            # строки, придержанные до обрыва, пишем раньше отметки о новом соединении
+            for message in endpoint.replay_filter.reconnected():
+                save_message(endpoint, history, message)
 
-            while True:
-                encoded_message = await reader.readline()
-                if not encoded_message:
-                    break
+        timestamp = datetime.now().strftime('%d.%m.%y %H:%M')
+        msg = f'[{timestamp}] Установлено соединение'
+        logger.info(f'{endpoint.name}: {msg}')
+        history.write_line(msg)
 
-                decoded_message = encoded_message.decode().strip()
-                timestamp = datetime.now().strftime('%d.%m.%y %H:%M')
-                formatted_log = f'[{timestamp}] {decoded_message}\n'
+        replay_filter = endpoint.replay_filter
+        offset = 0
+        while True:
+            if replay_filter and replay_filter.holding:
+                try:
+                    async with timeout(HOLD_TIMEOUT):
+                        encoded_messages = await connection.read_batch()
+                except asyncio.TimeoutError:
+                    for message in replay_filter.release():
+                        save_message(endpoint, history, message)
+                    continue
+            else:
+                encoded_messages = await connection.read_batch()
 
-                async with aiofiles.open(logfile, mode='a', encoding='utf-8') as f:
-                    await f.write(formatted_log)
-                    await f.flush()
+            if not encoded_messages:
+                if replay_filter:
+                    for message in replay_filter.release():
+                        save_message(endpoint, history, message)
+                raise ConnectionError('Сервер закрыл соединение')
 
-                logger.info(formatted_log.strip())
+            received_at = time.time()
+            for encoded_message in encoded_messages:
+                message = ChatMessage(encoded_message, received_at, offset=offset)
+                offset += len(encoded_message)
+                for message in replay_filter.feed(message) if replay_filter else (message,):
+                    save_message(endpoint, history, message)
+    finally:
+        connection.close()
 
-        except (ConnectionError, asyncio.TimeoutError, OSError):
-            logger.error('Ошибка соединения. Повторная попытка через 5 секунд...')
-            await asyncio.sleep(5)
-        finally:
-            if writer:
-                writer.close()
-                await writer.wait_closed()
+
+async def follow_endpoint(endpoint, resolver, max_line_size=DEFAULT_MAX_LINE_SIZE, **writer_options):
+    async with HistoryWriter(endpoint.history, **writer_options) as history:
+        await supervise_channel(
+            endpoint.channel,
+            partial(read_endpoint, endpoint=endpoint, history=history, max_line_size=max_line_size),
+            endpoint.host, endpoint.port, resolver
+        )
+
+
+async def watch_chat(host, port, logfile, max_line_size=DEFAULT_MAX_LINE_SIZE, dedup_window=DEFAULT_WINDOW,
+                     **writer_options):
+    endpoint = Endpoint(host, port, logfile, dedup_window)
+    await follow_endpoint(endpoint, ResolverCache(), max_line_size, **writer_options)
+
+
+async def report_stats(endpoints, interval):
+    last_counts = {endpoint.name: 0 for endpoint in endpoints}
+    while True:
+        await asyncio.sleep(interval)
+        total = 0
+        for endpoint in endpoints:
+            received = endpoint.messages - last_counts[endpoint.name]
+            last_counts[endpoint.name] = endpoint.messages
+            total += received
+            logger.info(
+                f'{endpoint.name}: {endpoint.channel.state}, {received / interval:.1f} сообщ./с, '
+                f'всего {endpoint.messages} сообщ. / {endpoint.bytes} байт, переподключений {endpoint.channel.failures}, '
+                f'пропущено повторов {endpoint.suppressed}'
+            )
+        connected = sum(endpoint.channel.state == 'established' for endpoint in endpoints)
+        logger.info(f'Всего: {connected}/{len(endpoints)} чатов на связи, {total / interval:.1f} сообщ./с')
+
+
+async def watch_endpoints(endpoints, writer_threads, stats_interval, max_line_size=DEFAULT_MAX_LINE_SIZE,
+                          **writer_options):
+    # Все чаты в одном цикле событий: общий резолвер и общий небольшой пул потоков для записи на диск
+    resolver = ResolverCache()
+    REGISTRY.gauge(
+        'minechat_endpoint_messages', 'Принято сообщений из каждого чата',
+        lambda: [({'endpoint': endpoint.name}, endpoint.messages) for endpoint in endpoints]
+    )
+    REGISTRY.gauge(
+        'minechat_endpoint_bytes', 'Принято байт из каждого чата',
+        lambda: [({'endpoint': endpoint.name}, endpoint.bytes) for endpoint in endpoints]
+    )
+    executor = ThreadPoolExecutor(max_workers=writer_threads, thread_name_prefix='history-writer')
+    try:
+        async with anyio.create_task_group() as tg:
+            for endpoint in endpoints:
+                tg.start_soon(partial(
+                    follow_endpoint, endpoint, resolver, max_line_size, executor=executor, **writer_options
+                ))
+            if stats_interval:
+                tg.start_soon(report_stats, endpoints, stats_interval)
+    finally:
+        executor.shutdown(wait=True)
 
 
 def get_args():
@@ -74,25 +191,143 @@ def get_args():
         help='Путь к файлу логов ',
         env_var='MINECHAT_HISTORY'
     )
+    parser.add_argument(
+        '--history-flush-size',
+        type=int,
+        default=DEFAULT_FLUSH_SIZE,
+        help='Размер пачки истории в байтах перед записью',
+        env_var='MINECHAT_HISTORY_FLUSH_SIZE'
+    )
+    parser.add_argument(
+        '--history-flush-interval',
+        type=float,
+        default=DEFAULT_FLUSH_INTERVAL,
+        help='Максимальная задержка записи истории, сек',
+        env_var='MINECHAT_HISTORY_FLUSH_INTERVAL'
+    )
+    parser.add_argument(
+        '--history-fsync',
+        action='store_true',
+        help='Делать fsync после каждой пачки истории',
+        env_var='MINECHAT_HISTORY_FSYNC'
+    )
+    parser.add_argument(
+        '--history-rotate-size',
+        type=int,
+        default=DEFAULT_ROTATE_SIZE,
+        help='Переносить историю в сжатый сегмент по достижении этого размера, байт (0 — не переносить)',
+        env_var='MINECHAT_HISTORY_ROTATE_SIZE'
+    )
+    parser.add_argument(
+        '--history-rotate-daily',
+        action='store_true',
+        help='Начинать новый сегмент истории каждый день',
+        env_var='MINECHAT_HISTORY_ROTATE_DAILY'
+    )
+    parser.add_argument(
+        '--search-index',
+        type=str,
+        help='Вести поисковый индекс истории в этой базе SQLite',
+        env_var='MINECHAT_SEARCH_INDEX'
+    )
+    parser.add_argument(
+        '--dedup-window',
+        type=int,
+        default=DEFAULT_WINDOW,
+        help='Сколько последних строк помнить, чтобы не писать в историю строки, '
+             'повторённые сервером после переподключения (0 — не отсеивать)',
+        env_var='MINECHAT_DEDUP_WINDOW'
+    )
+    parser.add_argument(
+        '--max-line-size',
+        type=int,
+        default=DEFAULT_MAX_LINE_SIZE,
+        help='Строки длиннее стольких байт обрезаются, остаток до перевода строки выбрасывается',
+        env_var='MINECHAT_MAX_LINE_SIZE'
+    )
+
+    parser.add_argument(
+        '--endpoint',
+        action='append',
+        help='Чат для архивации в виде host[:port][=файл истории]; можно указать несколько раз',
+        env_var='MINECHAT_ENDPOINTS'
+    )
+    parser.add_argument(
+        '--writer-threads',
+        type=int,
+        default=DEFAULT_WRITER_THREADS,
+        help='Сколько потоков пишут историю всех чатов на диск',
+        env_var='MINECHAT_WRITER_THREADS'
+    )
+    parser.add_argument(
+        '--stats-interval',
+        type=float,
+        default=DEFAULT_STATS_INTERVAL,
+        help='Как часто выводить статистику по чатам, сек (0 — не выводить)',
+        env_var='MINECHAT_STATS_INTERVAL'
+    )
+
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=0,
+        help='Порт HTTP для метрик в формате Prometheus (0 — не запускать)',
+        env_var='MINECHAT_METRICS_PORT'
+    )
+    parser.add_argument(
+        '--metrics-host',
+        type=str,
+        default='127.0.0.1',
+        help='Адрес, на котором отдавать метрики',
+        env_var='MINECHAT_METRICS_HOST'
+    )
+    event_loop.add_loop_argument(parser)
+    add_logging_arguments(parser)
 
     return parser.parse_args()
 
 
-async def main():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='{levelname} - {name} - {message}',
-        style='{'
-    )
+async def listen(args, writer_options):
+    if args.endpoint:
+        endpoints = [parse_endpoint(spec, args.port, args.history, args.dedup_window) for spec in args.endpoint]
+        if args.search_index:
+            logger.warning('Поисковый индекс ведётся только для одного чата, для списка чатов он отключён')
+        await watch_endpoints(endpoints, args.writer_threads, args.stats_interval, args.max_line_size,
+                              **writer_options)
+        return
+
+    if not args.search_index:
+        await watch_chat(args.host, args.port, args.history, args.max_line_size, args.dedup_window,
+                         **writer_options)
+        return
+
+    async with SearchIndex(args.search_index, args.history) as search_index:
+        await watch_chat(args.host, args.port, args.history, args.max_line_size, args.dedup_window,
+                         on_commit=search_index.notify, **writer_options)
 
-    load_dotenv()
-    args = get_args()
 
-    await watch_chat(args.host, args.port, args.history)
+async def main(args):
+    setup_logging(args.log_level or logging.INFO, args.log_levels, args.log_rate)
+
+    writer_options = {
+        'flush_size': args.history_flush_size,
+        'flush_interval': args.history_flush_interval,
+        'fsync': args.history_fsync,
+        'rotate_size': args.history_rotate_size,
+        'rotate_daily': args.history_rotate_daily,
+    }
+
+    async with anyio.create_task_group() as tg:
+        if args.metrics_port:
+            tg.start_soon(serve_metrics, args.metrics_host, args.metrics_port)
+        await listen(args, writer_options)
+        tg.cancel_scope.cancel()
 
 
 if __name__ == '__main__':
+    load_dotenv()
+    args = get_args()
     try:
-        asyncio.run(main())
+        event_loop.run(main(args), args.loop)
     except KeyboardInterrupt:
         logger.info('\nСкрипт остановлен пользователем.')
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+import time
+
+watchdog_logger = logging.getLogger('watchdog')
+
+DEFAULT_TIMEOUT = 30.0
+PINGS_PER_TIMEOUT = 3
+
+
+class ConnectionLiveness:
+    __slots__ = ('name', 'last_seen')
+
+    def __init__(self, name):
+        self.name = name
+        self.last_seen = time.monotonic()
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+
+class LivenessMonitor:
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        # Пинги чаще таймаута, чтобы тихий, но живой чат никогда не считался мёртвым
+        self.ping_interval = timeout / PINGS_PER_TIMEOUT
+        self.grace = self.ping_interval
+
+        self.timeouts = 0
+        self.false_positives = 0
+
+    def connection(self, name='minechat'):
+        return ConnectionLiveness(name)
+
+    async def watch(self, connection):
+        while True:
+            delay = connection.last_seen + self.timeout - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            suspected_last_seen = connection.last_seen
+            await asyncio.sleep(self.grace)
+            if connection.last_seen != suspected_last_seen:
+                self.false_positives += 1
+                watchdog_logger.info(
+                    '%s: активность вернулась после %ds тишины, соединение сохранено', connection.name, self.timeout
+                )
+                continue
+
+            self.timeouts += 1
+            watchdog_logger.info('%s: %ds timeout is elapsed', connection.name, self.timeout + self.grace)
+            raise ConnectionError('Watchdog detected connection timeout')
@@ -0,0 +1,138 @@
+import argparse
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+
+LOG_FORMAT = '{levelname} - {name} - {message}'
+DEFAULT_RATE_LIMITS = '__main__=50,watchdog=5'
+
+_listener = None
+
+
+class Lazy:
+    # дорогой аргумент записи: считается в потоке логирования и только если запись не отсеяна
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __str__(self):
+        return str(self.func(*self.args))
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # стандартный QueueHandler форматирует запись ещё в цикле событий; мы отдаём её потоку как есть
+    def prepare(self, record):
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate, burst=None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            # предупреждения и ошибки не прореживаем
+            return True
+
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            self.dropped += 1
+            return False
+
+        self.tokens -= 1
+        if self.dropped:
+            record.msg = f'{record.msg} (пропущено похожих записей: {self.dropped})'
+            self.dropped = 0
+        return True
+
+
+def parse_logger_options(spec, convert):
+    # «имя=значение,имя=значение»; корневой логгер — «root»
+    options = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, separator, value = item.partition('=')
+        if not separator:
+            raise argparse.ArgumentTypeError(f'ожидалось имя=значение, получено {item!r}')
+        try:
+            options[name.strip()] = convert(value.strip())
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'неверное значение для логгера {name.strip()}: {value.strip()!r}')
+    return options
+
+
+def parse_levels(spec):
+    return parse_logger_options(spec, parse_level)
+
+
+def parse_rate_limits(spec):
+    return parse_logger_options(spec, float)
+
+
+def parse_level(value):
+    level = logging.getLevelName(value.upper())
+    if not isinstance(level, int):
+        raise ValueError(value)
+    return level
+
+
+def add_logging_arguments(parser):
+    parser.add_argument('--log-level', type=parse_level, env_var='MINECHAT_LOG_LEVEL',
+                        help='Уровень логов: DEBUG, INFO, WARNING, ERROR')
+    parser.add_argument('--log-levels', default='', type=parse_levels, env_var='MINECHAT_LOG_LEVELS',
+                        help='Уровни отдельных логгеров, например «watchdog=WARNING,dedup=INFO»')
+    parser.add_argument('--log-rate', default=DEFAULT_RATE_LIMITS, type=parse_rate_limits, env_var='MINECHAT_LOG_RATE',
+                        help='Сколько записей в секунду пропускать от логгера, например «__main__=50,watchdog=5»; '
+                             'остальные отбрасываются и подсчитываются (пустая строка — без ограничений)')
+
+
+def setup_logging(level=logging.INFO, levels=None, rate_limits=None, stream=None):
+    # Запись в поток вывода и форматирование уходят в отдельный поток: цикл событий только кладёт запись в очередь
+    global _listener
+    stop_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT, style='{'))
+    records = queue.SimpleQueue()
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(None if name == 'root' else name).setLevel(logger_level)
+
+    for name, rate in (rate_limits or {}).items():
+        logger = logging.getLogger(None if name == 'root' else name)
+        for old_filter in [f for f in logger.filters if isinstance(f, RateLimitFilter)]:
+            logger.removeFilter(old_filter)
+        if rate > 0:
+            logger.addFilter(RateLimitFilter(rate))
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    # дописываем всё, что осталось в очереди, в том числе записи после выхода из цикла событий
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
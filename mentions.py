@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import re
+import string
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RELOAD_INTERVAL = 2.0
+
+# слова делим по пробелам и ASCII-пунктуации; «_» оставляем внутри слова, как в никах
+SEPARATORS = ''.join(chr(code) for code in range(33)) + string.punctuation.replace('_', '')
+_BYTES_SEPARATORS = bytes.maketrans(SEPARATORS.encode(), b' ' * len(SEPARATORS))
+_TEXT_SEPARATORS = str.maketrans(SEPARATORS, ' ' * len(SEPARATORS))
+# буквы, регистр которых складывается прямо в байтах UTF-8, без декодирования
+FOLDABLE_LETTERS = frozenset(string.ascii_lowercase + string.digits + '_абвгдеёжзийклмнопрстуфхцчшщъыьэюя')
+
+
+def _make_fold_table():
+    # Одна таблица для bytes.translate: разделители — в пробел, A-Z — в a-z, а у кириллицы А-я
+    # прописные и строчные сводятся к одним байтам (D1 → D0, 90-9F → B0-BF, A0-AF → 80-8F). Ё (D0 81) и ё (D1 91)
+    # делят второй байт с С и Б, поэтому 81, 91, A1 и B1 сводим в один: Б, С и Ё становятся неразличимы.
+    # Это не настоящий нижний регистр, а ключ сравнения: склеенные буквы и перемешанные чужие байты дают
+    # лишь ложные срабатывания фильтра, а их отсеивает сверка по декодированному тексту
+    table = bytearray(range(256))
+    for code in SEPARATORS.encode():
+        table[code] = ord(' ')
+    for code in range(ord('A'), ord('Z') + 1):
+        table[code] = code + 32
+    table[0xd1] = 0xd0
+    for code in range(0x90, 0xa0):
+        table[code] = code + 0x20
+    for code in range(0xa0, 0xb0):
+        table[code] = code - 0x20
+    for code in (0x91, 0xa1, 0xb1):
+        table[code] = 0x81
+    return bytes(table)
+
+
+_FOLD = _make_fold_table()
+
+found_mentions = REGISTRY.counter('minechat_mentions_total', 'Сообщений с упоминанием ника или слова из списка')
+
+
+def split_words(text):
+    return tuple(text.lower().translate(_TEXT_SEPARATORS).split())
+
+
+def fold_words(raw):
+    return raw.translate(_FOLD).split()
+
+
+def compile_literals(patterns):
+    # Шаблоны с пунктуацией («c++», «.net») при делении на слова теряют знаки и совпали бы с чем попало,
+    # поэтому их ищем целиком, без учёта регистра; длинные раньше коротких, чтобы «c++» не съело «c»
+    alternatives = [r'\s+'.join(map(re.escape, pattern.split()))
+                    for pattern in sorted(patterns, key=len, reverse=True)]
+    return re.compile(rf'(?<!\w)(?:{"|".join(alternatives)})(?!\w)', re.IGNORECASE)
+
+
+def literal_key(text):
+    return ' '.join(text.lower().split())
+
+
+def read_watch_list(path):
+    # одно слово или фраза на строку, «#» — комментарий
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+class MentionMatcher:
+    # Набор шаблонов — словарь по первому слову. Сообщение без декодирования одним translate сводится к ключу
+    # без учёта регистра, режется на слова и проверяется одним isdisjoint с множеством первых слов: цена зависит
+    # от длины строки, а не от числа шаблонов. Первые слова с буквами вне латиницы и русского алфавита (і, греческие)
+    # так не сложить — ради них строка декодируется, но только если такие шаблоны есть.
+    # Фразы целиком сверяем только у тех редких строк, где первое слово нашлось
+    def __init__(self, keywords=(), nickname=None):
+        self.keywords = list(keywords)
+        self.nickname = nickname
+        self._phrases = {}
+        self._first_words = frozenset()
+        self._decoded_first_words = frozenset()
+        self._literals = None
+        self._literal_patterns = {}
+        self._own_prefix = None
+        self._compile()
+
+    def set_keywords(self, keywords):
+        self.keywords = list(keywords)
+        self._compile()
+
+    def set_nickname(self, nickname):
+        if nickname != self.nickname:
+            self.nickname = nickname
+            self._compile()
+
+    def _compile(self):
+        phrases = {}
+        first_words = set()
+        decoded_first_words = set()
+        literal_patterns = {}
+        patterns = list(self.keywords)
+        if self.nickname:
+            patterns.append(self.nickname)
+
+        for pattern in patterns:
+            words = split_words(pattern)
+            if list(words) != pattern.lower().split():
+                literal_patterns.setdefault(literal_key(pattern), pattern)
+                continue
+            phrases.setdefault(words[0], []).append((words, pattern))
+            if FOLDABLE_LETTERS.issuperset(words[0]):
+                first_words.update(fold_words(words[0].encode()))
+            else:
+                decoded_first_words.add(words[0].encode())
+
+        literals = compile_literals(list(literal_patterns.values())) if literal_patterns else None
+        # подмена одним присваиванием: чтение чата никогда не видит наполовину собранный набор
+        self._phrases, self._first_words, self._decoded_first_words, self._literals, self._literal_patterns = (
+            phrases, frozenset(first_words), frozenset(decoded_first_words), literals, literal_patterns
+        )
+        self._own_prefix = f'{self.nickname}: '.encode() if self.nickname else None
+
+    def match(self, raw):
+        if self._own_prefix and raw.startswith(self._own_prefix):
+            # свои сообщения не подсвечиваем
+            return ()
+        # смотрим всю строку вместе с именем автора: в списке можно держать и ники других игроков
+        found = []
+        if self._has_first_word(raw):
+            self._match_phrases(split_words(raw.decode('utf-8', errors='replace')), found)
+        if self._literals:
+            self._match_literals(raw.decode('utf-8', errors='replace'), found)
+        if found:
+            found_mentions.inc()
+        return tuple(found)
+
+    def _has_first_word(self, raw):
+        if not self._first_words.isdisjoint(fold_words(raw)):
+            return True
+        if not self._decoded_first_words or raw.isascii():
+            return False
+        words = raw.decode('utf-8', errors='replace').lower().encode().translate(_BYTES_SEPARATORS).split()
+        return not self._decoded_first_words.isdisjoint(words)
+
+    def _match_phrases(self, words, found):
+        for position, word in enumerate(words):
+            for phrase, pattern in self._phrases.get(word, ()):
+                if words[position:position + len(phrase)] == phrase and pattern not in found:
+                    found.append(pattern)
+
+    def _match_literals(self, text, found):
+        for literal in self._literals.finditer(text):
+            pattern = self._literal_patterns[literal_key(literal.group())]
+            if pattern not in found:
+                found.append(pattern)
+
+    async def watch(self, path, interval=DEFAULT_RELOAD_INTERVAL):
+        # список перечитывается при смене времени изменения файла, без перезапуска клиента
+        loaded_at = -1
+        while True:
+            try:
+                modified_at = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                modified_at = None
+
+            if modified_at != loaded_at:
+                loaded_at = modified_at
+                if modified_at is None:
+                    logger.warning(f'Список слежения {path} не найден, слежу только за ником')
+                    self.set_keywords(())
+                else:
+                    try:
+                        self.set_keywords(read_watch_list(path))
+                    except (OSError, UnicodeDecodeError) as e:
+                        logger.error(f'Не удалось прочитать список слежения {path}: {e}')
+                    else:
+                        logger.info(f'Список слежения загружен: {len(self.keywords)} шаблонов')
+
+            await asyncio.sleep(interval)
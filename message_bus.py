@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from collections import deque
+
+from outbound_queue import BLOCK, DROP_OLDEST
+
+logger = logging.getLogger(__name__)
+
+COALESCE = 'coalesce'
+SUBSCRIBER_POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+DEFAULT_BUFFER_SIZE = 10000
+
+
+class Subscription:
+    def __init__(self, name, maxsize=DEFAULT_BUFFER_SIZE, policy=DROP_OLDEST):
+        if policy not in SUBSCRIBER_POLICIES:
+            raise ValueError(f'Неизвестная политика подписчика: {policy}')
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+
+        self.delivered = 0
+        self.dropped = 0
+        self.max_lag = 0
+
+        self._items = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+    def qsize(self):
+        return len(self._items)
+
+    def full(self):
+        return len(self._items) >= self.maxsize
+
+    def put_nowait(self, item):
+        if self.full():
+            if self.policy == COALESCE:
+                # медленному подписчику важна только свежая картина: всё накопленное схлопывается
+                self.dropped += len(self._items)
+                self._items.clear()
+            else:
+                # block без ожидания (подгрузка истории до старта) ведёт себя как drop-oldest
+                self._items.popleft()
+                self.dropped += 1
+
+        self._items.append(item)
+        self.max_lag = max(self.max_lag, len(self._items))
+        self._not_empty.set()
+        if self.full():
+            self._not_full.clear()
+
+    async def put(self, item):
+        if self.policy == BLOCK:
+            while self.full():
+                await self._not_full.wait()
+        self.put_nowait(item)
+
+    def get_nowait(self):
+        if not self._items:
+            raise asyncio.QueueEmpty()
+        item = self._items.popleft()
+        self.delivered += 1
+        if not self._items:
+            self._not_empty.clear()
+        self._not_full.set()
+        return item
+
+    async def get(self):
+        while not self._items:
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'lag': len(self._items),
+            'max_lag': self.max_lag,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+        }
+
+
+class MessageBus:
+    def __init__(self):
+        self.published = 0
+        self._subscriptions = {}
+
+    def subscribe(self, name, maxsize=DEFAULT_BUFFER_SIZE, policy=DROP_OLDEST):
+        subscription = Subscription(name, maxsize, policy)
+        self._subscriptions[name] = subscription
+        return subscription
+
+    def unsubscribe(self, name):
+        self._subscriptions.pop(name, None)
+
+    async def publish(self, message):
+        # Публикуют один раз: каждый подписчик получает тот же объект в свой кольцевой буфер
+        self.published += 1
+        for subscription in self._subscriptions.values():
+            if subscription.policy == BLOCK and subscription.full():
+                logger.debug(f'Подписчик {subscription.name} не успевает, чтение ждёт его')
+                await subscription.put(message)
+            else:
+                subscription.put_nowait(message)
+
+    def stats(self):
+        return {
+            'published': self.published,
+            'subscribers': {name: subscription.stats() for name, subscription in self._subscriptions.items()},
+        }
@@ -0,0 +1,52 @@
+import time
+from datetime import datetime
+from functools import lru_cache
+
+
+class ChatMessage:
+    # Сообщение создаётся один раз у сокета и одним объектом уходит во все очереди;
+    # текст декодируется и форматируется только тогда, когда его действительно показывают
+    __slots__ = ('raw', 'received_at', 'offset', 'mentions')
+
+    def __init__(self, raw, received_at=None, offset=0, mentions=()):
+        self.raw = raw
+        # время приёма с долями секунды: по нему окно считает задержку показа.
+        # Читатели ставят одно время на всю пачку строк, и строки пачки делят один объект float
+        self.received_at = time.time() if received_at is None else received_at
+        self.offset = offset
+        # найденные в строке ник и слова из списка слежения: окно подсвечивает такие строки
+        self.mentions = mentions
+
+    @property
+    def text(self):
+        return self.raw.decode('utf-8', errors='replace').strip()
+
+    @property
+    def nickname(self):
+        nickname, separator, _ = self.text.partition(': ')
+        return nickname if separator else None
+
+    @property
+    def body(self):
+        nickname, separator, body = self.text.partition(': ')
+        return body if separator else nickname
+
+    @property
+    def line(self):
+        return self.raw if self.raw.endswith(b'\n') else self.raw + b'\n'
+
+    def format_history(self):
+        return f'{timestamp_prefix(self.received_at).decode()}{self.text}'
+
+    def __str__(self):
+        return self.text
+
+
+@lru_cache(maxsize=4)
+def _minute_prefix(minute):
+    return datetime.fromtimestamp(minute * 60).strftime('[%d.%m.%y %H:%M] ').encode()
+
+
+def timestamp_prefix(received_at):
+    # время в истории с точностью до минуты: строку собираем раз в минуту, а не на каждое сообщение
+    return _minute_prefix(int(received_at // 60))
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in labels.items())
+    return f'{{{pairs}}}'
+
+
+class Counter:
+    # На горячем пути только сложение атрибута: без блокировок, снимок берётся при запросе.
+    # Счётчик, который уже ведёт сам объект (очередь, монитор), читается через collect
+    def __init__(self, name, help_text, labelnames=(), collect=None):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.collect = collect
+        self.value = 0
+        self._children = {}
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = Counter(self.name, self.help_text)
+        return child
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        if not self.labelnames:
+            lines.append(f'{self.name} {self.collect() if self.collect else self.value}')
+        for values, child in self._children.items():
+            lines.append(f'{self.name}{format_labels(dict(zip(self.labelnames, values)))} {child.value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value, count=1):
+        self.counts[bisect_left(self.buckets, value)] += count
+        self.sum += value * count
+        self.count += count
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f'{self.name}_sum {self.sum:.6f}')
+        lines.append(f'{self.name}_count {self.count}')
+        return lines
+
+
+class Gauge:
+    # Глубины очередей и состояния не пересчитываются на каждое сообщение: их читают только при запросе
+    def __init__(self, name, help_text, collect):
+        self.name = name
+        self.help_text = help_text
+        self.collect = collect
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge']
+        value = self.collect()
+        if isinstance(value, (int, float)):
+            lines.append(f'{self.name} {value}')
+            return lines
+        for labels, labelled_value in value:
+            lines.append(f'{self.name}{format_labels(labels)} {labelled_value}')
+        return lines
+
+
+class Snapshot:
+    # Готовые строки чужого реестра: так сетевой процесс отдаёт метрики окна из другого процесса
+    def __init__(self, name, collect):
+        self.name = name
+        self.collect = collect
+
+    def render(self):
+        return list(self.collect())
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, help_text, labelnames=(), collect=None):
+        if collect:
+            # как и у gauge, повторная регистрация заменяет сборщик
+            metric = self._metrics[name] = Counter(name, help_text, collect=collect)
+            return metric
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, collect):
+        # повторная регистрация заменяет сборщик: так перезапуск клиента в том же процессе не двоит метрики
+        metric = Gauge(name, help_text, collect)
+        self._metrics[name] = metric
+        return metric
+
+    def snapshot(self, name, collect):
+        metric = self._metrics[name] = Snapshot(name, collect)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error(f'Не удалось собрать метрику {metric.name}: {e!r}')
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+
+REGISTRY = MetricsRegistry()
+
+
+async def handle_metrics_request(reader, writer, registry):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+
+        if request_line.split()[1:2] == [b'/metrics']:
+            status, body = '200 OK', registry.render()
+        else:
+            status, body = '404 Not Found', 'Метрики по адресу /metrics\n'
+        body = body.encode()
+        writer.write(
+            f'HTTP/1.1 {status}\r\n'
+            f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n'.encode() + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host, port, registry=REGISTRY):
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_metrics_request(reader, writer, registry), host, port
+    )
+    logger.info(f'Метрики доступны на http://{host}:{port}/metrics')
+    async with server:
+        await server.serve_forever()
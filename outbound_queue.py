@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+DEFAULT_MAXSIZE = 1000
+DEFAULT_BATCH_SIZE = 64
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+REJECT = 'reject'
+POLICIES = (BLOCK, DROP_OLDEST, REJECT)
+
+send_latency = REGISTRY.histogram(
+    'minechat_send_latency_seconds', 'Время от постановки сообщения в очередь до drain() в сокет'
+)
+# число записей — _count, средняя пачка — _sum / _count, самая крупная видна по корзинам
+flush_size = REGISTRY.histogram(
+    'minechat_send_batch_size', 'Сообщений в одной записи в сокет', (1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+replayed_messages = REGISTRY.counter(
+    'minechat_send_replayed_total', 'Сообщений, отправленных повторно после обрыва до подтверждения пачки'
+)
+
+
+class OutboundQueue:
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, policy=REJECT, outbox=None):
+        if policy not in POLICIES:
+            raise ValueError(f'Неизвестная политика переполнения: {policy}')
+        self.maxsize = maxsize
+        self.policy = policy
+        self.outbox = outbox
+
+        self.dropped = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.flushed_messages = 0
+        self.max_flush = 0
+        self.replayed = 0
+
+        self._ids = itertools.count(1)
+        # Забранная, но не подтверждённая пачка: после обрыва её отдают снова, а не теряют
+        self._in_flight = []
+        self._items = deque()
+        if outbox:
+            # переживший перезапуск хвост журнала уходит первым, даже если он больше maxsize
+            now = time.monotonic()
+            self._items.extend((entry_id, item, now) for entry_id, item in outbox.open())
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+    def qsize(self):
+        return len(self._items)
+
+    def full(self):
+        return len(self._items) >= self.maxsize
+
+    def put_nowait(self, item):
+        dropped = None
+        if self.full():
+            if self.policy != DROP_OLDEST:
+                # синхронный отправитель (окно Tk) ждать не может: для него block равен reject
+                self.rejected += 1
+                raise asyncio.QueueFull()
+            dropped_id, dropped, _ = self._items.popleft()
+            self.dropped += 1
+            if self.outbox:
+                self.outbox.ack(dropped_id)
+
+        entry_id = self.outbox.append(item) if self.outbox else next(self._ids)
+        self._items.append((entry_id, item, time.monotonic()))
+        self._not_empty.set()
+        if self.full():
+            self._not_full.clear()
+        return dropped
+
+    async def put(self, item):
+        if self.policy == BLOCK:
+            while self.full():
+                await self._not_full.wait()
+        return self.put_nowait(item)
+
+    async def get_batch(self, max_items=DEFAULT_BATCH_SIZE):
+        if self._in_flight:
+            self.replayed += len(self._in_flight)
+            replayed_messages.inc(len(self._in_flight))
+            return [item for _, item, _ in self._in_flight]
+
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        count = min(max_items, len(self._items))
+        self._in_flight = [self._items.popleft() for _ in range(count)]
+        if not self._items:
+            self._not_empty.clear()
+        if not self.full():
+            self._not_full.set()
+
+        self.flushes += 1
+        self.flushed_messages += count
+        self.max_flush = max(self.max_flush, count)
+        flush_size.observe(count)
+        return [item for _, item, _ in self._in_flight]
+
+    def acknowledge(self):
+        # вызывается после drain(): пачка ушла в сокет, повторять её больше не нужно
+        if self._in_flight and self.outbox:
+            self.outbox.ack(self._in_flight[0][0], self._in_flight[-1][0])
+        now = time.monotonic()
+        for _, _, enqueued_at in self._in_flight:
+            send_latency.observe(now - enqueued_at)
+        self._in_flight = []
+
+    def stats(self):
+        return {
+            'depth': len(self._items),
+            'in_flight': len(self._in_flight),
+            'maxsize': self.maxsize,
+            'policy': self.policy,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+            'flushes': self.flushes,
+            'avg_flush': round(self.flushed_messages / self.flushes, 2) if self.flushes else 0.0,
+            'max_flush': self.max_flush,
+            'replayed': self.replayed,
+        }
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FSYNC_INTERVAL = 0.05
+DEFAULT_COMPACT_AFTER = 1000
+
+
+class Outbox:
+    def __init__(self, path, fsync_interval=DEFAULT_FSYNC_INTERVAL, compact_after=DEFAULT_COMPACT_AFTER):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.compact_after = compact_after
+
+        self.appended = 0
+        self.acked = 0
+        self.compactions = 0
+
+        self._file = None
+        self._next_id = 1
+        self._pending = {}
+        self._acked_since_compaction = 0
+        # пока идёт сжатие, новые записи копятся и здесь: их допишем в новый журнал перед подменой
+        self._compaction_tail = None
+        self._dirty = asyncio.Event()
+        # fsync уходит в отдельный поток, чтобы запись в журнал не ждала диск
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='outbox-fsync')
+
+    def open(self):
+        # Журнал: «+id текст» — сообщение поставлено в очередь, «-first last» — отрезок id отправлен
+        acked = set()
+        try:
+            with open(self.path, 'rb') as f:
+                for raw_line in f:
+                    if not raw_line.endswith(b'\n'):
+                        # недописанная при падении строка: сообщение не успело попасть в очередь
+                        break
+                    kind, _, payload = raw_line[:-1].decode('utf-8', errors='replace').partition(' ')
+                    if kind.startswith('+'):
+                        entry_id = int(kind[1:])
+                        if entry_id not in acked:
+                            self._pending.setdefault(entry_id, payload)
+                        self._next_id = max(self._next_id, entry_id + 1)
+                    elif kind.startswith('-'):
+                        first, last = int(kind[1:]), int(payload)
+                        for entry_id in range(first, last + 1):
+                            acked.add(entry_id)
+                            self._pending.pop(entry_id, None)
+        except FileNotFoundError:
+            pass
+
+        if self._pending:
+            logger.info(f'В журнале {self.path} осталось неотправленных сообщений: {len(self._pending)}')
+        self._compact()
+        return sorted(self._pending.items())
+
+    def append(self, message):
+        entry_id = self._next_id
+        self._next_id += 1
+        message = message.replace('\n', ' ')
+        self._pending[entry_id] = message
+        self._write(f'+{entry_id} {message}\n'.encode())
+        self.appended += 1
+        return entry_id
+
+    def ack(self, first_id, last_id=None):
+        last_id = first_id if last_id is None else last_id
+        # После перезапуска в пачке бывают пропуски id: считаем только то, что действительно ждало отправки,
+        # а по широкому отрезку не перебираем id, которых давно нет
+        if last_id - first_id >= len(self._pending):
+            entry_ids = [entry_id for entry_id in self._pending if first_id <= entry_id <= last_id]
+        else:
+            entry_ids = range(first_id, last_id + 1)
+        acked = sum(1 for entry_id in entry_ids if self._pending.pop(entry_id, None) is not None)
+        self._write(f'-{first_id} {last_id}\n'.encode())
+
+        self.acked += acked
+        self._acked_since_compaction += acked
+        if self._acked_since_compaction >= self.compact_after and self._compaction_tail is None:
+            self._start_compaction()
+
+    async def run(self):
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(self.fsync_interval)
+            self._dirty.clear()
+            try:
+                await asyncio.wrap_future(self._executor.submit(os.fsync, self._file.fileno()))
+            except (OSError, ValueError):
+                # журнал успели сжать и переоткрыть: новый файл синхронизирован при записи
+                pass
+
+    def close(self):
+        if self._file:
+            self._executor.submit(os.fsync, self._file.fileno()).result()
+            self._file.close()
+            self._file = None
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'appended': self.appended,
+            'acked': self.acked,
+            'compactions': self.compactions,
+        }
+
+    def _write(self, record):
+        self._file.write(record)
+        self._file.flush()
+        if self._compaction_tail is not None:
+            self._compaction_tail.append(record)
+        self._dirty.set()
+
+    def _write_snapshot(self, pending):
+        # переписываем журнал одними неотправленными сообщениями; файл остаётся открытым для дозаписи
+        f = open(f'{self.path}.tmp', 'wb')
+        try:
+            f.writelines(f'+{entry_id} {message}\n'.encode() for entry_id, message in pending)
+            f.flush()
+            os.fsync(f.fileno())
+        except OSError:
+            f.close()
+            raise
+        return f
+
+    def _compact(self):
+        # при открытии журнала, до работы цикла событий
+        if self._file:
+            self._file.close()
+        self._file = self._write_snapshot(list(self._pending.items()))
+        os.replace(f'{self.path}.tmp', self.path)
+        self._acked_since_compaction = 0
+        self.compactions += 1
+
+    def _start_compaction(self):
+        # Новый журнал пишется и синхронизируется в том же потоке, что и fsync, а цикл событий только
+        # дописывает в него хвост и атомарно подменяет старый. До подмены всё пишется и в старый журнал,
+        # так что падение посреди сжатия ничего не теряет
+        self._compaction_tail = []
+        self._acked_since_compaction = 0
+        future = asyncio.wrap_future(self._executor.submit(self._write_snapshot, list(self._pending.items())))
+        future.add_done_callback(self._finish_compaction)
+
+    def _finish_compaction(self, future):
+        tail, self._compaction_tail = self._compaction_tail, None
+        if future.cancelled():
+            return
+        if future.exception():
+            logger.error(f'Не удалось сжать журнал {self.path}: {future.exception()}')
+            return
+
+        new_file = future.result()
+        if not self._file:
+            # журнал уже закрыли: старый файл полон и остаётся на месте
+            new_file.close()
+            return
+        new_file.writelines(tail)
+        new_file.flush()
+        os.replace(f'{self.path}.tmp', self.path)
+
+        old_file, self._file = self._file, new_file
+        # закрываем в потоке fsync: туда мог уйти fsync старого файла
+        self._executor.submit(old_file.close)
+        self.compactions += 1
+        self._dirty.set()
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import anyio
+
+import event_loop
+from chat_client import start_pipeline
+from log_setup import setup_logging
+from message_bus import MessageBus
+from messages import ChatMessage
+from metrics import REGISTRY
+from outbound_queue import DROP_OLDEST, OutboundQueue
+from outbox import Outbox
+from statuses import GuiMetrics, HistoryCommitted, SendingQueueOverflow
+
+logger = logging.getLogger(__name__)
+
+STOP_TIMEOUT = 10.0
+METRICS_INTERVAL = 1.0
+
+
+def start_receiver(connection, deliver):
+    # Блокирующий recv — в потоке-демоне: он не держит ни цикл событий, ни выход из процесса.
+    # Следующий кадр читается, только когда цикл разобрал предыдущий, так что занятый цикл придерживает и канал
+    loop = asyncio.get_running_loop()
+
+    def receive():
+        while True:
+            try:
+                item = connection.recv()
+            except (EOFError, OSError):
+                item = None
+            try:
+                asyncio.run_coroutine_threadsafe(deliver(item), loop).result()
+            except (RuntimeError, CancelledError):
+                # цикл событий уже остановлен
+                return
+            if item is None:
+                return
+
+    threading.Thread(target=receive, name='pipeline-receiver', daemon=True).start()
+
+
+async def forward_to_gui(connection, messages, statuses):
+    # Всё, что накопилось с прошлой отправки, уходит окну одним кадром.
+    # Пишет в канал отдельный поток: если окно подвисло и канал полон, ждёт он, а сообщения для окна
+    # вытесняют старые в его подписке — чтение чата и история от этого не тормозят
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipeline-sender')
+    message_task = asyncio.ensure_future(messages.get())
+    status_task = asyncio.ensure_future(statuses.get())
+    try:
+        while True:
+            await asyncio.wait((message_task, status_task), return_when=asyncio.FIRST_COMPLETED)
+
+            frame_statuses, frame_messages = [], []
+            if status_task.done():
+                frame_statuses.append(status_task.result())
+                while not statuses.empty():
+                    frame_statuses.append(statuses.get_nowait())
+                status_task = asyncio.ensure_future(statuses.get())
+            if message_task.done():
+                frame_messages.append(message_task.result())
+                while messages.qsize():
+                    frame_messages.append(messages.get_nowait())
+                message_task = asyncio.ensure_future(messages.get())
+
+            frame = (frame_statuses, [(message.raw, message.received_at, message.mentions) for message in frame_messages])
+            await loop.run_in_executor(executor, connection.send, frame)
+    finally:
+        message_task.cancel()
+        status_task.cancel()
+        executor.shutdown(wait=False)
+
+
+async def run_pipeline(args, connection):
+    bus = MessageBus()
+    gui_messages = bus.subscribe('gui', args.max_scrollback, DROP_OLDEST)
+    statuses = asyncio.Queue()
+    outbox = Outbox(args.outbox or f'{args.history}.outbox', args.outbox_fsync_interval)
+    sending_queue = OutboundQueue(args.send_queue_size, args.send_queue_policy, outbox)
+    gui_closed = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    gui_metrics = []
+    REGISTRY.snapshot('gui', lambda: gui_metrics)
+
+    def on_commit(*_):
+        # зовётся из потока записи истории
+        loop.call_soon_threadsafe(statuses.put_nowait, HistoryCommitted())
+
+    async def accept_from_gui(text):
+        if text is None:
+            gui_closed.set()
+            return
+        if isinstance(text, GuiMetrics):
+            gui_metrics[:] = text.lines
+            return
+        try:
+            dropped = await sending_queue.put(text)
+        except asyncio.QueueFull:
+            statuses.put_nowait(SendingQueueOverflow(sending_queue.qsize()))
+            return
+        if dropped is not None:
+            statuses.put_nowait(SendingQueueOverflow(sending_queue.qsize(), dropped))
+
+    try:
+        async with anyio.create_task_group() as tg:
+            start_receiver(connection, accept_from_gui)
+            tg.start_soon(forward_to_gui, connection, gui_messages, statuses)
+            start_pipeline(tg, args, bus, sending_queue, outbox, statuses, on_commit=on_commit)
+
+            await gui_closed.wait()
+            tg.cancel_scope.cancel()
+    finally:
+        outbox.close()
+
+
+def run_pipeline_process(args, connection):
+    # Ctrl+C получает вся группа процессов; сетевой процесс останавливает окно, дописав историю и журнал
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(args.log_level or logging.DEBUG, args.log_levels, args.log_rate)
+    try:
+        event_loop.run(run_pipeline(args, connection), args.loop)
+    finally:
+        connection.close()
+
+
+class PipelineWorker:
+    # Сторона окна: вместо очереди отправки — канал к сетевому процессу, из него — сообщения и статусы
+    def __init__(self, args):
+        self.args = args
+        self.process = None
+        self._connection = None
+
+    def start(self):
+        # spawn, а не fork: дочернему процессу не достаются ни Tk, ни потоки окна
+        context = multiprocessing.get_context('spawn')
+        self._connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=run_pipeline_process, args=(self.args, child_connection), name='minechat-pipeline'
+        )
+        self.process.start()
+        child_connection.close()
+        logger.info(f'Сетевой процесс запущен, pid {self.process.pid}')
+
+    async def run(self, messages_queue, status_updates_queue, search_index=None):
+        self.start()
+        worker_exited = asyncio.Event()
+
+        async def deliver(frame):
+            if frame is None:
+                worker_exited.set()
+                return
+            statuses, messages = frame
+            for status in statuses:
+                if isinstance(status, HistoryCommitted):
+                    if search_index:
+                        search_index.notify()
+                else:
+                    status_updates_queue.put_nowait(status)
+            for raw, received_at, mentions in messages:
+                messages_queue.put_nowait(ChatMessage(raw, received_at, mentions=mentions))
+
+        start_receiver(self._connection, deliver)
+        await worker_exited.wait()
+        await asyncio.get_running_loop().run_in_executor(None, self.process.join, STOP_TIMEOUT)
+        logger.error(f'Сетевой процесс завершился (код {self.process.exitcode})')
+        raise ConnectionError('Сетевой процесс завершился')
+
+    async def send_metrics(self, render_metrics, interval=METRICS_INTERVAL):
+        # метрики окна отдаёт сетевой процесс вместе со своими: раз в interval шлём ему их снимок
+        while True:
+            await asyncio.sleep(interval)
+            if self._connection:
+                self._connection.send(GuiMetrics(render_metrics()))
+
+    def qsize(self):
+        return 0
+
+    def put_nowait(self, text):
+        self._connection.send(text)
+
+    async def put(self, text):
+        self.put_nowait(text)
+
+    def close(self):
+        if not self.process:
+            return
+        try:
+            self._connection.send(None)
+        except OSError:
+            pass
+        self.process.join(STOP_TIMEOUT)
+        if self.process.is_alive():
+            logger.warning('Сетевой процесс не остановился вовремя, завершаю принудительно')
+            self.process.terminate()
+            self.process.join()
+        self._connection.close()
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+import configargparse
+from async_timeout import timeout
+from dotenv import load_dotenv
+
+from reconnect import Backoff
+from registration import register
+from tools import percentile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 20
+DEFAULT_RETRIES = 3
+REGISTRATION_TIMEOUT = 10.0
+
+
+def load_provisioned(credentials_path):
+    # файл дописывается по строке на аккаунт, так что прерванный прогон можно просто запустить ещё раз
+    provisioned = set()
+    try:
+        with open(credentials_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    provisioned.add(json.loads(line)['nickname'])
+                except (json.JSONDecodeError, KeyError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return provisioned
+
+
+class ProvisionReport:
+    def __init__(self):
+        self.registered = 0
+        self.failed = 0
+        self.retries = 0
+        self.latencies = []
+        self.started_at = time.perf_counter()
+
+    def log(self):
+        elapsed = time.perf_counter() - self.started_at
+        logger.info(
+            f'Зарегистрировано {self.registered}, не удалось {self.failed}, повторов {self.retries} '
+            f'за {elapsed:.2f} с ({self.registered / elapsed:.1f} рег./с)'
+        )
+        if self.latencies:
+            logger.info(
+                f'Время регистрации: p50 {percentile(self.latencies, 0.5) * 1000:.1f} мс, '
+                f'p95 {percentile(self.latencies, 0.95) * 1000:.1f} мс'
+            )
+
+
+async def register_with_retries(host, port, nickname, retries, report):
+    backoff = Backoff()
+    for attempt in range(retries + 1):
+        started_at = time.perf_counter()
+        try:
+            async with timeout(REGISTRATION_TIMEOUT):
+                account = await register(host, port, nickname)
+            report.latencies.append(time.perf_counter() - started_at)
+            return account
+        except (ConnectionError, OSError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+            if attempt == retries:
+                logger.error(f'{nickname}: регистрация не удалась ({e!r})')
+                return None
+            report.retries += 1
+            await asyncio.sleep(backoff.next_delay())
+
+
+async def provision_worker(host, port, nicknames, credentials, retries, report):
+    while nicknames:
+        nickname = nicknames.pop()
+        account = await register_with_retries(host, port, nickname, retries, report)
+        if not account:
+            report.failed += 1
+            continue
+
+        credentials.write(json.dumps({
+            'nickname': account['nickname'],
+            'account_hash': account['account_hash'],
+            'host': host,
+            'port': port,
+        }, ensure_ascii=False) + '\n')
+        credentials.flush()
+        report.registered += 1
+
+
+async def provision_accounts(host, port, nicknames, credentials_path, concurrency, retries):
+    report = ProvisionReport()
+    provisioned = load_provisioned(credentials_path)
+    # пул соединений — это просто фиксированное число воркеров, разбирающих общий список ников
+    pending = [nickname for nickname in reversed(nicknames) if nickname not in provisioned]
+    if len(pending) < len(nicknames):
+        logger.info(f'Уже зарегистрированы в {credentials_path}: {len(nicknames) - len(pending)}')
+
+    with open(credentials_path, 'a', encoding='utf-8') as credentials:
+        await asyncio.gather(*[
+            provision_worker(host, port, pending, credentials, retries, report)
+            for _ in range(min(concurrency, len(pending)))
+        ])
+    report.log()
+    return report
+
+
+def get_args():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--host', default='minechat.dvmn.org', env_var='MINECHAT_HOST')
+    parser.add_argument('--port', default=5050, type=int, env_var='MINECHAT_WRITE_PORT')
+    parser.add_argument('--count', default=100, type=int, help='Сколько аккаунтов зарегистрировать')
+    parser.add_argument('--prefix', default='loadtest-', help='Начало ника: к нему добавляется номер аккаунта')
+    parser.add_argument('--nicknames', help='Файл с никами, по одному на строку, вместо --count и --prefix')
+    parser.add_argument('--credentials', default='accounts.jsonl', env_var='MINECHAT_CREDENTIALS',
+                        help='Куда записать аккаунты: по строке JSON на аккаунт')
+    parser.add_argument('--concurrency', default=DEFAULT_CONCURRENCY, type=int,
+                        help='Сколько регистраций идёт одновременно')
+    parser.add_argument('--retries', default=DEFAULT_RETRIES, type=int, help='Сколько раз повторять неудачную регистрацию')
+    return parser.parse_args()
+
+
+async def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='{levelname} - {name} - {message}',
+        style='{'
+    )
+
+    load_dotenv()
+    args = get_args()
+
+    if args.nicknames:
+        with open(args.nicknames, encoding='utf-8') as f:
+            nicknames = [line.strip() for line in f if line.strip()]
+    else:
+        nicknames = [f'{args.prefix}{number:04d}' for number in range(args.count)]
+
+    logger.info(f'Регистрирую {len(nicknames)} аккаунтов на {args.host}:{args.port}, '
+                f'одновременно {args.concurrency}, результат — {os.path.abspath(args.credentials)}')
+    await provision_accounts(args.host, args.port, nicknames, args.credentials, args.concurrency, args.retries)
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info('Регистрация прервана, готовые аккаунты уже в файле.')
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import random
+import socket
+import time
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# столько должно продержаться соединение, чтобы обрыв снова считался первым, а не очередным
+DEFAULT_STABLE_AFTER = 10.0
+
+RECONNECT_ERRORS = (ConnectionError, OSError, asyncio.TimeoutError, socket.gaierror)
+
+reconnects = REGISTRY.counter(
+    'minechat_reconnects_total', 'Переподключения каналов по причинам', ('channel', 'cause')
+)
+
+
+class Backoff:
+    def __init__(self, base=0.5, cap=30.0, factor=2.0):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.attempt = 0
+
+    def next_delay(self):
+        # full jitter: клиенты, отвалившиеся одновременно, расходятся по всему окну ожидания
+        ceiling = min(self.cap, self.base * self.factor ** self.attempt)
+        self.attempt += 1
+        return random.uniform(0, ceiling)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class ResolverCache:
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self._cache = {}
+
+    async def resolve(self, host, port):
+        key = (host, port)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1][0]
+
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._cache[key] = (time.monotonic() + self.ttl, addresses)
+        return addresses[0]
+
+    def rotate(self, host, port):
+        # следующая попытка пойдёт на другой адрес из того же ответа DNS
+        cached = self._cache.get((host, port))
+        if cached and len(cached[1]) > 1:
+            addresses = cached[1]
+            addresses.append(addresses.pop(0))
+
+    def invalidate(self, host, port):
+        self._cache.pop((host, port), None)
+
+
+class ChannelState:
+    def __init__(self, name):
+        self.name = name
+        self.state = 'idle'
+        self.connects = 0
+        self.failures = 0
+        self.next_delay = 0.0
+        self.established_at = None
+        self.is_confirmed = False
+
+    def established(self):
+        self.state = 'established'
+        self.connects += 1
+        self.established_at = time.monotonic()
+        self.is_confirmed = False
+
+    def confirmed(self):
+        # TCP-подключение ещё ничего не значит: сервер может принять и сразу закрыть.
+        # Канал отправки подтверждает авторизация; для чтения и первые строки не довод — сервер шлёт повтор
+        # последних сообщений сразу при подключении, поэтому чтение считается рабочим, только продержавшись
+        self.is_confirmed = True
+
+    def uptime(self):
+        return time.monotonic() - self.established_at if self.established_at else 0.0
+
+    def failed(self, delay):
+        self.state = 'backoff'
+        self.failures += 1
+        self.next_delay = delay
+        self.established_at = None
+
+
+def unwrap_reconnect_error(error):
+    # из группы задач сбой приходит завёрнутым: переподключаемся, только если внутри одни сбои связи,
+    # а ошибку в коде отдаём наверх, а не повторяем бесконечно
+    while isinstance(error, ExceptionGroup):
+        _, rest = error.split(RECONNECT_ERRORS)
+        if rest is not None:
+            return None
+        error = error.exceptions[0]
+    return error
+
+
+async def supervise_channel(channel, run_channel, host, port, resolver, backoff=None,
+                            stable_after=DEFAULT_STABLE_AFTER):
+    backoff = backoff or Backoff()
+
+    while True:
+        channel.state = 'connecting'
+        connects_before = channel.connects
+        try:
+            address = await resolver.resolve(host, port)
+            await run_channel(address)
+            raise ConnectionError('Сервер закрыл соединение')
+        except (*RECONNECT_ERRORS, ExceptionGroup) as error:
+            e = unwrap_reconnect_error(error)
+            if e is None:
+                raise
+            if channel.connects == connects_before:
+                resolver.rotate(host, port)
+            elif channel.is_confirmed or channel.uptime() >= stable_after:
+                # задержку сбрасываем только после рабочего соединения: иначе сервер, который принимает
+                # и сразу закрывает, получает переподключения в первом окне ожидания без конца
+                backoff.reset()
+            if isinstance(e, socket.gaierror):
+                resolver.invalidate(host, port)
+
+            delay = backoff.next_delay()
+            channel.failed(delay)
+            reconnects.labels(channel.name, type(e).__name__).inc()
+            logger.info(f'{channel.name}: потеря соединения ({e!r}). Повторная попытка через {delay:.1f} сек...')
+            await asyncio.sleep(delay)
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+from functools import partial
+
+from dotenv import load_dotenv
+
+import event_loop
+from chat_client import InvalidToken, add_session_arguments, log_status_updates, send_msgs
+from liveness import LivenessMonitor
+from log_setup import setup_logging
+from metrics import serve_metrics
+from outbound_queue import OutboundQueue
+from outbox import Outbox
+from rate_limit import TokenBucket
+from reconnect import ChannelState, ResolverCache, supervise_channel
+from send_minechat import RELAY_ACCEPTED, RELAY_REJECTED, create_parser, get_default_socket_path
+from tools import sanitize_text
+
+logger = logging.getLogger(__name__)
+
+
+
+def parse_args():
+    parser = create_parser()
+    add_session_arguments(parser)
+    parser.add_argument('--relay-socket', env_var='MINECHAT_RELAY_SOCKET', help='Путь к UNIX-сокету ретранслятора')
+    return parser.parse_args()
+
+
+async def handle_relay_client(reader, writer, sending_queue):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            message = sanitize_text(line.decode(errors='replace'))
+            if message:
+                try:
+                    # при политике block клиент ждёт здесь: это и есть обратное давление на сокет
+                    dropped = await sending_queue.put(message)
+                except asyncio.QueueFull:
+                    writer.write(RELAY_REJECTED)
+                    await writer.drain()
+                    continue
+                if dropped is not None:
+                    logger.warning(f"Очередь переполнена, выброшено старое сообщение: '{dropped}'")
+            writer.write(RELAY_ACCEPTED)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def run_relay(args):
+    outbox = Outbox(args.outbox or f'{args.history}.relay.outbox', args.outbox_fsync_interval)
+    sending_queue = OutboundQueue(args.send_queue_size, args.send_queue_policy, outbox)
+    status_updates_queue = asyncio.Queue()
+    liveness_monitor = LivenessMonitor(args.watchdog_timeout)
+    send_channel = ChannelState('send')
+
+    socket_path = args.relay_socket or get_default_socket_path()
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    server = await asyncio.start_unix_server(
+        partial(handle_relay_client, sending_queue=sending_queue), socket_path
+    )
+    os.chmod(socket_path, 0o600)
+    logger.info(f'Ретранслятор слушает {socket_path}')
+
+    run_channel = partial(
+        send_msgs, port=args.port, token=args.token, sending_queue=sending_queue,
+        status_updates_queue=status_updates_queue, liveness=liveness_monitor.connection(args.host),
+        ping_interval=liveness_monitor.ping_interval, channel=send_channel,
+        bucket=TokenBucket(args.rate) if args.rate else None, max_batch=args.send_batch
+    )
+    coroutines = [
+        supervise_channel(send_channel, run_channel, args.host, args.port, ResolverCache()),
+        log_status_updates(status_updates_queue),
+        outbox.run(),
+    ]
+    if args.metrics_port:
+        coroutines.append(serve_metrics(args.metrics_host, args.metrics_port))
+
+    try:
+        async with server:
+            await asyncio.gather(*coroutines)
+    finally:
+        outbox.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+async def main(args):
+    setup_logging(args.log_level or logging.INFO, args.log_levels, args.log_rate)
+
+    if not args.token:
+        logger.error('Для ретранслятора нужен токен: --token или ACCOUNT_HASH в .env')
+        return
+
+    try:
+        await run_relay(args)
+    except InvalidToken as e:
+        logger.error(f'{e} Ретранслятор остановлен.')
+
+
+if __name__ == '__main__':
+    load_dotenv()
+    args = parse_args()
+    try:
+        event_loop.run(main(args), args.loop)
+    except KeyboardInterrupt:
+        logger.info('Ретранслятор остановлен.')
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import configargparse
+
+from history_storage import iter_history_sources, load_manifest
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1024 * 1024
+DEFAULT_LIMIT = 100
+
+SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(body);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+'''
+
+
+def build_match_query(text):
+    terms = [term.replace('"', '""') for term in text.split()]
+    if not terms:
+        return None
+    # последнее слово ищем по префиксу, чтобы поиск работал по мере набора
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+
+def connect(db_path):
+    connection = sqlite3.connect(db_path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class SearchIndex:
+    def __init__(self, db_path, history_path):
+        self.db_path = db_path
+        self.history_path = history_path
+        self.indexed_lines = 0
+
+        self._signals = queue.Queue()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='search-index', daemon=True)
+        # поиск идёт своим соединением, чтобы не ждать индексации большой пачки
+        self._search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search-query')
+        self._search_connection = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def start(self):
+        self._thread.start()
+        self.notify()
+
+    def notify(self, *_):
+        # можно звать из любого потока: история дописана, пора доиндексировать хвост файла
+        self._signals.put(True)
+
+    def close(self):
+        self._stopping.set()
+        self._signals.put(None)
+        self._thread.join()
+        self._search_executor.submit(self._close_search_connection)
+        self._search_executor.shutdown(wait=True)
+
+    async def search(self, text, limit=DEFAULT_LIMIT):
+        return await asyncio.wrap_future(self._search_executor.submit(self.search_sync, text, limit))
+
+    def search_sync(self, text, limit=DEFAULT_LIMIT):
+        match_query = build_match_query(text)
+        if not match_query:
+            return []
+        if self._search_connection is None:
+            self._search_connection = connect(self.db_path)
+        try:
+            rows = self._search_connection.execute(
+                'SELECT body FROM messages WHERE messages MATCH ? ORDER BY rowid DESC LIMIT ?',
+                (match_query, limit)
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.error(f'Не удалось выполнить поиск «{text}»: {e}')
+            return []
+        return [body for body, in rows]
+
+    def _close_search_connection(self):
+        if self._search_connection is not None:
+            self._search_connection.close()
+
+    def catch_up(self):
+        connection = connect(self.db_path)
+        try:
+            self._index_new_lines(connection, self._load_position(connection))
+        finally:
+            connection.close()
+
+    def _run(self):
+        connection = connect(self.db_path)
+        try:
+            position = self._load_position(connection)
+            while True:
+                signal = self._signals.get()
+                while signal is not None and not self._signals.empty():
+                    signal = self._signals.get()
+                if signal is None:
+                    return
+                position = self._index_new_lines(connection, position)
+        except (OSError, sqlite3.Error) as e:
+            logger.error(f'Индексация истории остановлена: {e}')
+        finally:
+            connection.close()
+
+    def _load_position(self, connection):
+        state = dict(connection.execute('SELECT key, value FROM state').fetchall())
+        # старая база помнила inode вместо номера источника: такую строим заново
+        sequence = int(state['sequence']) if state.get('sequence') else None
+        position = (sequence, int(state.get('offset', 0)))
+
+        if state.get('history_path') != os.path.abspath(self.history_path) or not self._is_known(position):
+            # другой файл, файл обрезали или пропал сегмент: строим индекс заново
+            position = self._reset(connection)
+        return position
+
+    def _is_known(self, position):
+        sequence, offset = position
+        if sequence is None:
+            return offset == 0
+        if sequence == load_manifest(self.history_path)['active_sequence']:
+            return os.path.exists(self.history_path) and os.path.getsize(self.history_path) >= offset
+        return sequence in [source_sequence for source_sequence, _ in iter_history_sources(self.history_path)]
+
+    def _reset(self, connection):
+        connection.execute('DELETE FROM messages')
+        position = (None, 0)
+        self._save_position(connection, position)
+        connection.commit()
+        return position
+
+    def _save_position(self, connection, position):
+        sequence, offset = position
+        connection.executemany(
+            'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+            [
+                ('history_path', os.path.abspath(self.history_path)),
+                ('sequence', str(sequence or '')),
+                ('offset', str(offset)),
+            ]
+        )
+
+    def _index_new_lines(self, connection, position):
+        started_at = time.perf_counter()
+        indexed_before = self.indexed_lines
+
+        sources = list(iter_history_sources(self.history_path))
+        sequences = [source_sequence for source_sequence, _ in sources]
+        sequence, offset = position
+        if sequence is not None and sequence not in sequences:
+            sequence, offset = self._reset(connection)
+        # после ротации дочитываем прежний файл уже из сегмента под тем же номером, затем идём к более новым
+        first_source = sequences.index(sequence) if sequence in sequences else 0
+
+        for source_sequence, open_source in sources[first_source:]:
+            if source_sequence != sequence:
+                sequence, offset = source_sequence, 0
+            offset = self._index_source(connection, sequence, open_source, offset)
+            if self._stopping.is_set():
+                break
+
+        if self.indexed_lines - indexed_before > 10000:
+            elapsed = time.perf_counter() - started_at
+            logger.info(f'Проиндексировано {self.indexed_lines - indexed_before} строк истории за {elapsed:.1f} с')
+        return (sequence, offset)
+
+    def _index_source(self, connection, sequence, open_source, offset):
+        try:
+            source = open_source()
+        except FileNotFoundError:
+            return offset
+
+        with source:
+            source.seek(offset)
+            tail = b''
+            while not self._stopping.is_set():
+                chunk = source.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                data = tail + chunk
+                complete_end = data.rfind(b'\n') + 1
+                tail = data[complete_end:]
+                if not complete_end:
+                    continue
+
+                lines = data[:complete_end].decode('utf-8', errors='replace').splitlines()
+                rows = [(line.strip(),) for line in lines if line.strip()]
+                connection.executemany('INSERT INTO messages (body) VALUES (?)', rows)
+                offset += complete_end
+                self._save_position(connection, (sequence, offset))
+                connection.commit()
+                self.indexed_lines += len(rows)
+        return offset
+
+
+def get_args():
+    parser = configargparse.ArgParser()
+    parser.add_argument('--history', default='chat_logfile.txt', env_var='MINECHAT_HISTORY', help='Путь к файлу истории')
+    parser.add_argument('--search-index', help='Путь к базе поискового индекса (по умолчанию рядом с историей)')
+    parser.add_argument('--limit', default=DEFAULT_LIMIT, type=int, help='Сколько совпадений показать')
+    parser.add_argument('query', nargs='+', help='Что искать')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='{levelname} - {name} - {message}',
+        style='{'
+    )
+
+    args = get_args()
+    index = SearchIndex(args.search_index or f'{args.history}.search.sqlite', args.history)
+    index.catch_up()
+
+    started_at = time.perf_counter()
+    results = index.search_sync(' '.join(args.query), args.limit)
+    elapsed = time.perf_counter() - started_at
+    for line in reversed(results):
+        print(line)
+    logger.info(f'Найдено {len(results)} за {elapsed * 1000:.1f} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,32 @@
 import asyncio
 import json
 import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
 
 import configargparse
 from dotenv import load_dotenv
 
+import event_loop
+from log_setup import add_logging_arguments, setup_logging
+from rate_limit import TokenBucket
+from reconnect import Backoff
 from registration import register
-from tools import sanitize_text, save_token_to_env
+from tools import percentile, sanitize_text, save_token_to_env
 
 logger = logging.getLogger(__name__)
 
+BATCH_MAX_PENDING = 10000
+BATCH_HIGH_WATER = 256 * 1024
+BATCH_ACK_WAIT = 5.0
+
+RELAY_ACCEPTED = b'ok\n'
+RELAY_REJECTED = b'full\n'
+
 
 async def submit_message(writer, message):
     cleaned_message = sanitize_text(message)
@@ -22,15 +39,36 @@ async def submit_message(writer, message):
     await writer.drain()
 
 
-def parse_args():
+def get_default_socket_path():
+    uid = os.getuid() if hasattr(os, 'getuid') else 'user'
+    return os.path.join(tempfile.gettempdir(), f'minechat-relay-{uid}.sock')
+
+
+def create_parser():
+    # общие настройки send_minechat, chat_client и relay: куда подключаться, под кем и куда писать историю
     parser = configargparse.ArgParser()
     parser.add_argument('--host', default='minechat.dvmn.org', env_var='MINECHAT_HOST')
     parser.add_argument('--port', default=5050, type=int, env_var='MINECHAT_WRITE_PORT')
     parser.add_argument('--token', env_var='ACCOUNT_HASH', help='Твой хэш аккаунта')
     parser.add_argument('--nickname', help='Имя пользователя для регистрации')
     parser.add_argument('--history', default='chat_history.txt', help='Путь к файлу истории чата')
+    parser.add_argument('--rate', default=0.0, type=float, env_var='MINECHAT_SEND_RATE',
+                        help='Не больше стольких сообщений в секунду (0 — без ограничения)')
+    event_loop.add_loop_argument(parser)
+    add_logging_arguments(parser)
+    return parser
+
+
+def parse_args(argv=None):
+    parser = create_parser()
     parser.add_argument('--message', help='Текст сообщения')
-    return parser.parse_args()
+    parser.add_argument('--batch', help='Отправить все сообщения из файла, по одному на строку («-» — читать stdin)')
+    parser.add_argument('--ndjson', action='store_true',
+                        help='В пакетном режиме каждая строка — JSON: строка или объект с полем message')
+    parser.add_argument('--relay', action='store_true', env_var='MINECHAT_RELAY',
+                        help='Передать сообщение запущенному ретранслятору (relay.py), а если его нет — отправить напрямую')
+    parser.add_argument('--relay-socket', env_var='MINECHAT_RELAY_SOCKET', help='Путь к UNIX-сокету ретранслятора')
+    return parser.parse_args(argv)
 
 
 async def authorise(reader, writer, token):
@@ -50,6 +88,206 @@ async def authorise(reader, writer, token):
     return decode_response
 
 
+def parse_batch_line(line, ndjson):
+    if not ndjson:
+        return sanitize_text(line)
+
+    line = line.strip()
+    if not line:
+        return ''
+    try:
+        payload = json.loads(line)
+    except json.JSONDecodeError:
+        logger.error(f'Пропускаю строку, это не JSON: {line[:80]}')
+        return ''
+
+    if isinstance(payload, dict):
+        payload = payload.get('message') or ''
+    return sanitize_text(str(payload))
+
+
+class LineFeed:
+    # Источник читает поток построчно: readline отдаёт строку, как только она пришла по каналу, а не когда
+    # наберётся буфер. Цикл событий забирает всё накопленное одной пачкой, поэтому быстрый файл уходит пачками,
+    # а медленный производитель в конвейере — строка за строкой без задержки
+    def __init__(self, source, max_pending=BATCH_MAX_PENDING):
+        self.source = source
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._finished = False
+        self._error = None
+        self._ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        threading.Thread(target=self._run, name='batch-reader', daemon=True).start()
+
+    async def read(self):
+        while True:
+            with self._condition:
+                if self._pending:
+                    lines = list(self._pending)
+                    self._pending.clear()
+                    self._condition.notify()
+                    return lines
+                if self._error:
+                    raise self._error
+                if self._finished:
+                    return []
+                self._ready.clear()
+            await self._ready.wait()
+
+    def _run(self):
+        try:
+            for line in iter(self.source.readline, ''):
+                with self._condition:
+                    # отправка не успевает: не читаем дальше, пока цикл не разберёт накопленное
+                    while len(self._pending) >= self.max_pending:
+                        self._condition.wait()
+                    self._pending.append(line)
+                    if len(self._pending) == 1:
+                        self._wake()
+        except (OSError, ValueError) as e:
+            with self._condition:
+                self._error = e
+        finally:
+            with self._condition:
+                self._finished = True
+            self._wake()
+
+    def _wake(self):
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # цикл событий уже закрыт
+            pass
+
+
+async def read_batch(source, ndjson):
+    feed = LineFeed(source)
+    while True:
+        lines = await feed.read()
+        if not lines:
+            return
+        messages = [parse_batch_line(line, ndjson) for line in lines]
+        yield [message for message in messages if message]
+
+
+class BatchReport:
+    def __init__(self):
+        self.written = 0
+        self.reconnects = 0
+        self.latencies = []
+        self.started_at = time.perf_counter()
+
+    def log(self, unacked):
+        elapsed = time.perf_counter() - self.started_at
+        delivered = len(self.latencies)
+        logger.info(
+            f'Подтверждено {delivered} сообщений за {elapsed:.2f} с ({delivered / elapsed:.0f} сообщ./с), '
+            f'записано в сокет {self.written}, переподключений {self.reconnects}, без подтверждения {unacked}'
+        )
+        if self.latencies:
+            logger.info(
+                f'Задержка до подтверждения: p50 {percentile(self.latencies, 0.5) * 1000:.1f} мс, '
+                f'p95 {percentile(self.latencies, 0.95) * 1000:.1f} мс, '
+                f'p99 {percentile(self.latencies, 0.99) * 1000:.1f} мс'
+            )
+
+
+async def collect_acks(reader, unacked, report):
+    # сервер отвечает строкой на каждое принятое сообщение: по ней считаем задержку
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('Сервер закрыл соединение')
+        if unacked:
+            _, sent_at = unacked.popleft()
+            report.latencies.append(time.perf_counter() - sent_at)
+
+
+async def pipeline_messages(writer, outgoing, unacked, bucket, report):
+    while outgoing:
+        if bucket:
+            await bucket.acquire()
+        message = outgoing.popleft()
+        writer.write(f'{message}\n\n'.encode())
+        unacked.append((message, time.perf_counter()))
+        report.written += 1
+        # drain только когда буфер сокета заметно наполнился, а не на каждое сообщение
+        if writer.transport.get_write_buffer_size() > BATCH_HIGH_WATER:
+            await writer.drain()
+    await writer.drain()
+
+
+async def wait_acks(unacked, ack_task):
+    deadline = time.monotonic() + BATCH_ACK_WAIT
+    while unacked and not ack_task.done() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def send_batch(args):
+    report = BatchReport()
+    bucket = TokenBucket(args.rate) if args.rate else None
+    backoff = Backoff()
+    outgoing = deque()
+    unacked = deque()
+
+    source = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+    chunks = read_batch(source, args.ndjson)
+    source_exhausted = False
+
+    try:
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection(args.host, args.port)
+                if not await authorise(reader, writer, args.token):
+                    return
+                backoff.reset()
+
+                ack_task = asyncio.create_task(collect_acks(reader, unacked, report))
+                try:
+                    while not source_exhausted or outgoing:
+                        if not outgoing:
+                            chunk = await anext(chunks, None)
+                            if chunk is None:
+                                source_exhausted = True
+                                continue
+                            outgoing.extend(chunk)
+                        await pipeline_messages(writer, outgoing, unacked, bucket, report)
+                        if ack_task.done():
+                            ack_task.result()
+                    await wait_acks(unacked, ack_task)
+                finally:
+                    ack_task.cancel()
+                return
+            except (ConnectionError, OSError) as e:
+                # неподтверждённые отправим заново первыми, чтобы сохранить порядок
+                outgoing.extendleft(message for message, _ in reversed(unacked))
+                unacked.clear()
+                report.reconnects += 1
+                delay = backoff.next_delay()
+                logger.error(f'Потеряно соединение с сервером: {e!r}. Повторная попытка через {delay:.1f} сек...')
+                await asyncio.sleep(delay)
+            finally:
+                if writer:
+                    writer.close()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        report.log(len(unacked) + len(outgoing))
+
+
+async def send_via_relay(socket_path, message):
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    try:
+        writer.write(f'{message}\n'.encode())
+        await writer.drain()
+        return await reader.readline() == RELAY_ACCEPTED
+    finally:
+        writer.close()
+
+
 async def handle_connection(args):
     token = args.token
     reader, writer = await asyncio.open_connection(args.host, args.port)
@@ -87,22 +325,33 @@ async def handle_connection(args):
         await writer.wait_closed()
 
 
-async def main():
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='{levelname} - {name} - {message}',
-        style='{'
-    )
+async def main(args):
+    setup_logging(args.log_level or logging.DEBUG, args.log_levels, args.log_rate)
 
-    load_dotenv()
+    if args.relay and args.message and not args.batch:
+        socket_path = args.relay_socket or get_default_socket_path()
+        try:
+            if await send_via_relay(socket_path, sanitize_text(args.message)):
+                logger.info('Сообщение передано ретранслятору.')
+                return
+        except (OSError, AttributeError) as e:
+            # AttributeError — на платформах без UNIX-сокетов
+            logger.debug(f'Ретранслятор недоступен ({e!r}), отправляю напрямую.')
 
-    args = parse_args()
+    if not args.batch:
+        await handle_connection(args)
+        return
 
-    await handle_connection(args)
+    if not args.token:
+        logger.error('Для пакетной отправки нужен токен. Зарегистрируйтесь через --nickname.')
+        return
+    await send_batch(args)
 
 
 if __name__ == '__main__':
+    load_dotenv()
+    args = parse_args()
     try:
-        asyncio.run(main())
+        event_loop.run(main(args), args.loop)
     except KeyboardInterrupt:
         pass
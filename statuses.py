@@ -0,0 +1,56 @@
+from enum import Enum
+
+
+class ReadConnectionStateChanged(Enum):
+    INITIATED = 'устанавливаем соединение'
+    ESTABLISHED = 'соединение установлено'
+    CLOSED = 'соединение закрыто'
+
+    def __str__(self):
+        return str(self.value)
+
+
+class SendingConnectionStateChanged(Enum):
+    INITIATED = 'устанавливаем соединение'
+    ESTABLISHED = 'соединение установлено'
+    CLOSED = 'соединение закрыто'
+    INVALID_TOKEN = 'неверный токен, отправка остановлена'
+
+    def __str__(self):
+        return str(self.value)
+
+
+class NicknameReceived:
+    def __init__(self, nickname):
+        self.nickname = nickname
+
+
+class HistoryCommitted:
+    # сетевой процесс дописал историю: окну пора обновить поисковый индекс
+    pass
+
+
+class GuiMetrics:
+    # снимок метрик окна для сетевого процесса, который в режиме --worker-process отдаёт /metrics
+    def __init__(self, lines):
+        self.lines = lines
+
+
+class MentionFound:
+    def __init__(self, text, keywords):
+        self.text = text
+        self.keywords = keywords
+
+    def __str__(self):
+        return f'{", ".join(self.keywords)}: {self.text}'
+
+
+class SendingQueueOverflow:
+    def __init__(self, depth, dropped=None):
+        self.depth = depth
+        self.dropped = dropped
+
+    def __str__(self):
+        if self.dropped is not None:
+            return f'очередь переполнена ({self.depth}), старое сообщение выброшено'
+        return f'очередь переполнена ({self.depth}), сообщение не принято'
@@ -0,0 +1,78 @@
+from dedup import ReplayFilter
+from messages import ChatMessage
+
+
+def feed_lines(replay_filter, lines):
+    passed = []
+    for line in lines:
+        passed.extend(message.raw for message in replay_filter.feed(ChatMessage(line)))
+    return passed
+
+
+def make_filter(history):
+    replay_filter = ReplayFilter('test')
+    assert feed_lines(replay_filter, history) == history
+    assert replay_filter.reconnected() == []
+    return replay_filter
+
+
+def test_replayed_tail_is_suppressed():
+    replay_filter = make_filter([b'a: 1\n', b'a: 2\n', b'a: 3\n'])
+
+    assert feed_lines(replay_filter, [b'a: 2\n', b'a: 3\n', b'a: 4\n']) == [b'a: 4\n']
+    assert replay_filter.suppressed == 2
+
+
+def test_longest_replay_wins():
+    replay_filter = make_filter([b'x\n', b'y\n', b'x\n', b'y\n'])
+
+    assert feed_lines(replay_filter, [b'x\n', b'y\n', b'x\n', b'y\n', b'z\n']) == [b'z\n']
+    assert replay_filter.suppressed == 4
+
+
+def test_replay_without_following_lines_is_suppressed_on_release():
+    replay_filter = make_filter([b'a: 1\n', b'a: 2\n'])
+
+    assert feed_lines(replay_filter, [b'a: 1\n', b'a: 2\n']) == []
+    assert replay_filter.release() == []
+    assert replay_filter.suppressed == 2
+
+
+def test_old_line_repeated_without_replay_is_kept():
+    replay_filter = make_filter([b'a: hi\n', b'b: 1\n', b'b: 2\n'])
+
+    assert feed_lines(replay_filter, [b'a: hi\n']) == []
+    assert replay_filter.holding
+    assert [message.raw for message in replay_filter.release()] == [b'a: hi\n']
+    assert replay_filter.suppressed == 0
+
+
+def test_held_lines_are_released_when_connection_drops():
+    replay_filter = make_filter([b'a: hi\n', b'b: 1\n', b'b: 2\n'])
+
+    assert feed_lines(replay_filter, [b'a: hi\n']) == []
+    assert [message.raw for message in replay_filter.reconnected()] == [b'a: hi\n']
+    assert replay_filter.suppressed == 0
+
+
+def test_confirmed_part_is_suppressed_when_connection_drops():
+    replay_filter = make_filter([b'x\n', b'y\n', b'x\n', b'y\n'])
+
+    # «x y» уже дошла до хвоста окна, «x y x» ещё может оказаться более длинным повтором
+    assert feed_lines(replay_filter, [b'x\n', b'y\n', b'x\n']) == []
+    assert [message.raw for message in replay_filter.reconnected()] == [b'x\n']
+    assert replay_filter.suppressed == 2
+
+
+def test_broken_run_releases_held_lines():
+    replay_filter = make_filter([b'bot: ping\n', b'bot: ping\n', b'a: last\n'])
+
+    lines = [b'bot: ping\n', b'bot: ping\n', b'a: new\n']
+    assert feed_lines(replay_filter, lines) == lines
+    assert replay_filter.suppressed == 0
+
+
+def test_lines_after_release_are_not_matched_again():
+    replay_filter = make_filter([b'a: hi\n', b'b: 1\n'])
+
+    assert feed_lines(replay_filter, [b'a: hi\n', b'c: new\n', b'b: 1\n']) == [b'a: hi\n', b'c: new\n', b'b: 1\n']
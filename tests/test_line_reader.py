@@ -0,0 +1,43 @@
+import asyncio
+
+from line_reader import open_line_connection
+
+
+async def read_all(payload, **protocol_options):
+    async def handle(reader, writer):
+        writer.write(payload)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    connection = await open_line_connection('127.0.0.1', port, **protocol_options)
+    lines = []
+    try:
+        while batch := await connection.read_batch():
+            lines.extend(batch)
+    finally:
+        connection.close()
+        server.close()
+        await server.wait_closed()
+    return lines, connection.oversized
+
+
+def test_lines_are_split():
+    lines, oversized = asyncio.run(read_all(b'a: 1\nb: 2\nc: 3\n'))
+    assert lines == [b'a: 1\n', b'b: 2\n', b'c: 3\n']
+    assert oversized == 0
+
+
+def test_cap_below_buffer_size_cuts_long_lines():
+    payload = b'before\n' + b'x' * 5000 + b'\n' + b'y' * 300_000 + b'\n' + b'z' * 1000 + b'\nafter\n'
+    lines, oversized = asyncio.run(read_all(payload, max_line_size=1000))
+    assert lines == [b'before\n', b'x' * 1000 + b'\n', b'y' * 1000 + b'\n', b'z' * 1000 + b'\n', b'after\n']
+    assert oversized == 2
+
+
+def test_cap_above_buffer_size_grows_buffer():
+    payload = b'x' * 100_000 + b'\n' + b'y' * 10_000 + b'\nafter\n'
+    lines, oversized = asyncio.run(read_all(payload, max_line_size=50_000, buffer_size=4096))
+    assert lines == [b'x' * 50_000 + b'\n', b'y' * 10_000 + b'\n', b'after\n']
+    assert oversized == 1
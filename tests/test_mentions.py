@@ -0,0 +1,35 @@
+from mentions import MentionMatcher
+
+
+def match(matcher, line):
+    return matcher.match(f'{line}\n'.encode())
+
+
+def test_mixed_case_words_match():
+    matcher = MentionMatcher(['deploy', 'ошибка сборки'], nickname='Вася')
+
+    assert match(matcher, 'a: DePloy готов') == ('deploy',)
+    assert match(matcher, 'a: снова ОшИбКа   сборки!') == ('ошибка сборки',)
+    assert match(matcher, 'a: привет, вАСЯ') == ('Вася',)
+
+
+def test_yo_and_other_alphabets_match_in_any_case():
+    matcher = MentionMatcher(['ёлка', 'Їжак'])
+
+    assert match(matcher, 'a: ЁЛКА горит') == ('ёлка',)
+    assert match(matcher, 'a: елка горит') == ()
+    assert match(matcher, 'a: їжак') == ('Їжак',)
+
+
+def test_patterns_with_punctuation_match_literally():
+    matcher = MentionMatcher(['c++', '.net'])
+
+    assert match(matcher, 'a: пишу на C++') == ('c++',)
+    assert match(matcher, 'a: пишу на c') == ()
+    assert match(matcher, 'a: .NET или нет') == ('.net',)
+
+
+def test_own_messages_are_not_mentions():
+    matcher = MentionMatcher(['deploy'], nickname='Вася')
+
+    assert match(matcher, 'Вася: deploy') == ()
@@ -0,0 +1,86 @@
+import asyncio
+
+from outbound_queue import OutboundQueue
+from outbox import Outbox
+
+
+def reopen(path):
+    outbox = Outbox(path)
+    pending = outbox.open()
+    outbox.close()
+    return pending
+
+
+def test_torn_last_line_is_ignored_on_replay(tmp_path):
+    path = tmp_path / 'outbox'
+    path.write_bytes(b'+1 a\n+2 b\n-1 1\n+3 c')
+
+    outbox = Outbox(path)
+    assert outbox.open() == [(2, 'b')]
+    # id недописанной строки занимает следующее сообщение
+    assert outbox.append('d') == 3
+    outbox.close()
+
+    assert reopen(path) == [(2, 'b'), (3, 'd')]
+
+
+def test_range_ack_over_gaps_counts_only_pending(tmp_path):
+    path = tmp_path / 'outbox'
+    path.write_bytes(b'+3 a\n+7 b\n+9 c\n')
+
+    outbox = Outbox(path)
+    assert outbox.open() == [(3, 'a'), (7, 'b'), (9, 'c')]
+    outbox.ack(3, 9)
+    outbox.ack(3, 9)
+    assert outbox.stats()['acked'] == 3
+    assert outbox.stats()['pending'] == 0
+    outbox.close()
+
+    assert reopen(path) == []
+
+
+def test_append_and_ack_during_compaction_survive(tmp_path):
+    path = tmp_path / 'outbox'
+
+    async def run():
+        outbox = Outbox(path, compact_after=2)
+        outbox.open()
+        for message in ('a', 'b', 'c'):
+            outbox.append(message)
+        outbox.ack(1, 2)
+        # сжатие идёт в потоке, а очередь тем временем пишет дальше
+        assert outbox._compaction_tail is not None
+        outbox.append('d')
+        outbox.ack(3)
+        while outbox._compaction_tail is not None:
+            await asyncio.sleep(0.001)
+        assert outbox.compactions == 2
+        outbox.append('e')
+        outbox.close()
+
+    asyncio.run(run())
+
+    assert reopen(path) == [(4, 'd'), (5, 'e')]
+    assert not (tmp_path / 'outbox.tmp').exists()
+
+
+def test_unacknowledged_batch_is_resent_after_reconnect(tmp_path):
+    path = tmp_path / 'outbox'
+
+    async def run():
+        outbox = Outbox(path)
+        queue = OutboundQueue(outbox=outbox)
+        for message in ('a', 'b', 'c'):
+            queue.put_nowait(message)
+        assert await queue.get_batch(2) == ['a', 'b']
+        # соединение оборвалось до drain(): та же пачка уходит снова, а не следующая
+        assert await queue.get_batch(2) == ['a', 'b']
+        assert queue.replayed == 2
+        queue.acknowledge()
+        assert await queue.get_batch(2) == ['c']
+        outbox.close()
+
+    asyncio.run(run())
+
+    # неподтверждённое сообщение переживает и перезапуск
+    assert reopen(path) == [(3, 'c')]
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from reconnect import Backoff, ChannelState, supervise_channel, unwrap_reconnect_error
+
+
+class FixedResolver:
+    async def resolve(self, host, port):
+        return host
+
+    def rotate(self, host, port):
+        pass
+
+    def invalidate(self, host, port):
+        pass
+
+
+def supervise(errors):
+    # канал падает с ошибками по очереди, а когда они кончаются — останавливает проверку
+    attempts = []
+
+    async def run_channel(address):
+        attempts.append(address)
+        if not errors:
+            raise asyncio.CancelledError()
+        raise errors.pop(0)
+
+    async def run():
+        await supervise_channel(ChannelState('test'), run_channel, 'host', 0, FixedResolver(), Backoff(base=0))
+
+    with pytest.raises((asyncio.CancelledError, Exception)) as error:
+        asyncio.run(run())
+    return len(attempts), error.value
+
+
+def test_connection_errors_in_group_are_unwrapped():
+    error = ConnectionError('closed')
+    assert unwrap_reconnect_error(ExceptionGroup('tg', [ExceptionGroup('inner', [error])])) is error
+
+
+def test_group_with_programming_error_is_not_retried():
+    group = ExceptionGroup('tg', [ConnectionError('closed'), KeyError('nickname')])
+    assert unwrap_reconnect_error(group) is None
+
+
+def test_supervisor_retries_connection_errors():
+    attempts, error = supervise([ConnectionError('closed'), ExceptionGroup('tg', [TimeoutError()])])
+
+    assert attempts == 3
+    assert isinstance(error, asyncio.CancelledError)
+
+
+def test_supervisor_raises_programming_errors():
+    attempts, error = supervise([ExceptionGroup('tg', [ValueError('bug')])])
+
+    assert attempts == 1
+    assert isinstance(error, ExceptionGroup)
@@ -16,3 +16,10 @@ def save_token_to_env(token):
         logger.info('Токен сохранен в файл .env')
     except OSError as e:
         logger.error(f'Не удалось сохранить токен: {e}')
+
+
+def percentile(values, share):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]